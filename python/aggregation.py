@@ -0,0 +1,101 @@
+"""Fixed-memory aggregation of high-rate samples between uploads."""
+import math
+from array import array
+
+# The faminga_sensors/{id} snapshot is only written once per window, and the
+# app (dashboard_provider.dart) shows a sensor offline once that snapshot is
+# more than 60 s old. A window must close before then, allowing for one poll
+# interval and a slow commit.
+MAX_UPLOAD_INTERVAL = 45
+
+
+class RingBuffer:
+    """Fixed-capacity float buffer; the oldest values are overwritten when full."""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self._data = array('d', [0.0]) * self.capacity
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        self._data[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def values(self):
+        """Stored values, oldest first."""
+        if self._size < self.capacity:
+            return self._data[:self._size]
+        return self._data[self._head:] + self._data[:self._head]
+
+
+def summarize(values):
+    """min/max/mean/stddev (population) of a sequence of floats."""
+    n = len(values)
+    if n == 0:
+        return None
+    mean = sum(values) / n
+    variance = sum((v - mean) ** 2 for v in values) / n
+    return {
+        'min': round(min(values), 2),
+        'max': round(max(values), 2),
+        'mean': round(mean, 2),
+        'stddev': round(math.sqrt(variance), 3),
+    }
+
+
+class Aggregator:
+    """Collect moisture/temperature samples for one upload window.
+
+    Memory is constant: each channel lives in a RingBuffer sized for one
+    window at the sampling rate. If a window runs long, only the most
+    recent `capacity` samples are summarized (sampleCount still reports how
+    many were taken). Windows are capped at MAX_UPLOAD_INTERVAL seconds.
+    """
+
+    def __init__(self, sample_interval, upload_interval):
+        upload_interval = min(upload_interval, MAX_UPLOAD_INTERVAL)
+        self.upload_interval = upload_interval
+        capacity = math.ceil(upload_interval / max(sample_interval, 0.001)) + 1
+        self.moisture = RingBuffer(capacity)
+        self.temperature = RingBuffer(capacity)
+        self.sample_count = 0
+        self.window_start = None
+
+    def add(self, moisture, temperature, now):
+        if self.window_start is None:
+            self.window_start = now
+        self.moisture.append(moisture)
+        self.temperature.append(temperature)
+        self.sample_count += 1
+
+    def due(self, now):
+        return self.window_start is not None and now - self.window_start >= self.upload_interval
+
+    def flush(self, now):
+        """Return the window summary and start a new window (None if empty)."""
+        if self.sample_count == 0:
+            return None
+        summary = {
+            'moisture': summarize(self.moisture.values()),
+            'temperature': summarize(self.temperature.values()),
+            'sampleCount': self.sample_count,
+            'windowSeconds': round(now - self.window_start, 1),
+        }
+        self.reset()
+        return summary
+
+    def reset(self):
+        self.moisture.clear()
+        self.temperature.clear()
+        self.sample_count = 0
+        self.window_start = None
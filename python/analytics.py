@@ -0,0 +1,380 @@
+"""Vectorized offline analytics over the local reading history.
+
+Loads a sensor's CSV log (including rotated files) or binary history store
+into NumPy arrays and computes, without per-row Python loops:
+
+- the same moisture/temperature band classification as evaluate_conditions()
+- trailing rolling means
+- time-in-band percentages (weighted by sample duration, outages excluded)
+- moisture rate of change and drying rate (%-points per hour)
+- irrigation events (fast moisture rises)
+- one row per sensor and local day, for fleet-wide daily reports
+
+    python analytics.py sensor_data_*.csv --from 2025-11-01 --output report.json
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from conditions import GOOD, HIGH, LOW, MOISTURE_DRY, MOISTURE_WET, TEMP_COLD, TEMP_HOT
+from csv_logger import load_index
+from history_query import parse_time, read_rotated
+from history_store import read_history
+
+logger = logging.getLogger(__name__)
+
+CSV_DTYPE = np.dtype([('t', 'datetime64[us]'), ('moisture', 'f8'), ('temperature', 'f8')])
+
+# Defaults for the derived series (seconds / %-points)
+ROLLING_WINDOW = 3600
+SMOOTHING_WINDOW = 300
+RATE_WINDOW = 1800
+EVENT_MIN_RISE = 5.0
+
+
+# --- Loading ---
+
+def _utc_offsets(t, local=False):
+    """Local UTC offset (s) for each time in sorted `t`, looked up once per hour.
+
+    `t` holds epochs, or with `local` naive local times counted as if they
+    were UTC (the offset is then resolved like datetime.timestamp() does).
+    """
+    hours = np.floor(t / 3600).astype(np.int64)
+    starts = np.flatnonzero(np.diff(hours, prepend=hours[:1] - 1))
+    if local:
+        offsets = [h * 3600 - time.mktime(time.gmtime(h * 3600)[:8] + (-1,)) for h in hours[starts].tolist()]
+    else:
+        offsets = [time.localtime(h * 3600).tm_gmtoff for h in hours[starts].tolist()]
+    return np.repeat(np.array(offsets, dtype=np.float64), np.diff(np.append(starts, len(t))))
+
+
+def _load_csv_file(path):
+    """(t, moisture, temperature) of one CSV file; naive timestamps are local time."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline=None) as f:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # empty file
+            try:
+                records = np.loadtxt(f, delimiter=',', skiprows=1, dtype=CSV_DTYPE, ndmin=1)
+            except ValueError:
+                records = None
+    if records is None:
+        # A torn or malformed row: fall back to the tolerant row parser
+        logger.warning(f"{path}: malformed rows, parsing line by line")
+        rows = np.array(read_rotated(path, -np.inf, np.inf), dtype=np.float64).reshape(-1, 3)
+        return rows[:, 0], rows[:, 1], rows[:, 2]
+
+    naive = records['t'].astype(np.int64) / 1e6
+    return naive - _utc_offsets(naive, local=True), records['moisture'], records['temperature']
+
+
+def load_csv(csv_path, start=None, end=None):
+    """(t, moisture, temperature) float64 arrays from a CSV log and its rotated files."""
+    index_path = f"{os.path.splitext(csv_path)[0]}.index.json"
+    directory = os.path.dirname(csv_path)
+    paths = []
+    for entry in load_index(index_path):
+        if start is not None and parse_time(entry['end']) < start:
+            continue
+        if end is not None and parse_time(entry['start']) >= end:
+            continue
+        paths.append(os.path.join(directory, entry['file']))
+    if os.path.exists(csv_path):
+        paths.append(csv_path)
+
+    parts = []
+    for path in paths:
+        try:
+            parts.append(_load_csv_file(path))
+        except OSError as e:
+            logger.warning(f"Skipping unreadable history file {path}: {e}")
+    if not parts:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    t, moisture, temperature = (np.concatenate(column) for column in zip(*parts))
+    if np.any(np.diff(t) < 0):
+        order = np.argsort(t, kind='stable')
+        t, moisture, temperature = t[order], moisture[order], temperature[order]
+    return _window(t, moisture, temperature, start, end)
+
+
+def _window(t, moisture, temperature, start, end):
+    lo = 0 if start is None else int(np.searchsorted(t, start, side='left'))
+    hi = len(t) if end is None else int(np.searchsorted(t, end, side='left'))
+    return t[lo:hi], moisture[lo:hi], temperature[lo:hi]
+
+
+def load(path, start=None, end=None):
+    """History of one sensor from a binary store (.bin) or a CSV log, as float64 arrays."""
+    if path.endswith('.bin'):
+        t, moisture, temperature = read_history(path, start, end)
+        return t.astype(np.float64), moisture.astype(np.float64), temperature.astype(np.float64)
+    return load_csv(path, start, end)
+
+
+# --- Classification ---
+
+def classify(values, low, high):
+    """Band code per value (LOW, GOOD, HIGH), matching conditions.band()."""
+    values = np.asarray(values)
+    codes = np.full(values.shape, HIGH, dtype=np.int8)
+    codes[values <= high] = GOOD
+    codes[values < low] = LOW
+    return codes
+
+
+def classify_moisture(moisture):
+    return classify(moisture, MOISTURE_DRY, MOISTURE_WET)
+
+
+def classify_temperature(temperature):
+    return classify(temperature, TEMP_COLD, TEMP_HOT)
+
+
+# --- Derived series ---
+
+def sample_durations(t, max_gap_factor=10):
+    """Seconds each sample stands for: the gap to the next one.
+
+    Gaps longer than `max_gap_factor` times the median interval (sensor or
+    service offline) count as one median interval, as does the last sample.
+    """
+    if len(t) < 2:
+        return np.ones(len(t))
+    gaps = np.diff(t)
+    typical = float(np.median(gaps)) or 1.0
+    gaps = np.where(gaps > max_gap_factor * typical, typical, gaps)
+    return np.append(gaps, typical)
+
+
+def _search_sorted(t, keys, side):
+    """np.searchsorted(t, keys, side) for sorted `keys`.
+
+    A stable sort of the two concatenated runs is a single linear merge,
+    which beats a binary search per key once the arrays outgrow the cache.
+    """
+    n = len(t)
+    order = np.argsort(np.concatenate((keys, t) if side == 'left' else (t, keys)), kind='stable')
+    return np.flatnonzero(order < n if side == 'left' else order >= n) - np.arange(n)
+
+
+def trailing_start(t, window):
+    """Index of the oldest sample within [t - window, t], for every sample."""
+    return _search_sorted(t, t - window, 'left')
+
+
+def rolling_mean(t, values, window=ROLLING_WINDOW):
+    """Mean of `values` over the trailing (t - window, t] at every sample."""
+    csum = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    lo = _search_sorted(t, t - window, 'right')
+    hi = np.arange(1, len(t) + 1)
+    return (csum[hi] - csum[lo]) / (hi - lo)
+
+
+def _rate(t, smooth, lo):
+    elapsed = t - t[lo]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(elapsed > 0, (smooth - smooth[lo]) / elapsed * 3600, np.nan)
+
+
+def moisture_rate(t, moisture, window=RATE_WINDOW):
+    """Moisture change in %-points per hour over the trailing `window` (NaN where undefined).
+
+    Differentiates the rolling mean over SMOOTHING_WINDOW seconds, so sensor
+    jitter does not show up as rate spikes.
+    """
+    smooth = rolling_mean(t, moisture, SMOOTHING_WINDOW)
+    return _rate(t, smooth, trailing_start(t, window))
+
+
+def drying_rate(t, moisture, window=RATE_WINDOW):
+    """Moisture loss in %-points per hour (positive while the soil dries)."""
+    return -moisture_rate(t, moisture, window)
+
+
+def time_in_band(t, codes, weights=None):
+    """Percentage of time spent below, inside and above the band."""
+    weights = sample_durations(t) if weights is None else weights
+    total = weights.sum()
+    if total == 0:
+        return {'low': 0.0, 'good': 0.0, 'high': 0.0}
+    shares = np.bincount(codes + 1, weights, minlength=3) / total * 100
+    return {'low': round(float(shares[0]), 2), 'good': round(float(shares[1]), 2),
+            'high': round(float(shares[2]), 2)}
+
+
+def _event_spans(smooth, lo, min_rise):
+    """[begin, peak] sample indices of every rise of >= `min_rise` (overlapping rises merged)."""
+    rising = (smooth - smooth[lo]) >= min_rise
+    edges = np.diff(rising.astype(np.int8), prepend=0, append=0)
+    run_starts = np.flatnonzero(edges == 1)
+    if len(run_starts) == 0:
+        return []
+    run_ends = np.flatnonzero(edges == -1)
+
+    # Peak of each run: its first sample reaching the run maximum
+    bounds = np.stack((run_starts, run_ends), axis=1).ravel()
+    run_max = np.maximum.reduceat(np.append(smooth, 0.0), bounds)[::2]
+    run_id = np.cumsum(edges[:-1] == 1) - 1
+    at_max = np.flatnonzero(rising & (smooth == run_max[run_id]))
+    peaks = at_max[np.unique(run_id[at_max], return_index=True)[1]]
+
+    spans = []
+    for begin, peak in zip(lo[run_starts].tolist(), peaks.tolist()):
+        if spans and begin <= spans[-1][1]:
+            # Still the same watering: extend the previous event
+            if smooth[peak] > smooth[spans[-1][1]]:
+                spans[-1][1] = peak
+            continue
+        spans.append([begin, peak])
+    return spans
+
+
+def _event_dicts(t, smooth, spans):
+    return [{'start': float(t[begin]), 'peak': float(t[peak]), 'before': round(float(smooth[begin]), 2),
+             'after': round(float(smooth[peak]), 2), 'rise': round(float(smooth[peak] - smooth[begin]), 2)}
+            for begin, peak in spans]
+
+
+def irrigation_events(t, moisture, min_rise=EVENT_MIN_RISE, window=RATE_WINDOW):
+    """Irrigation (or rain) events: smoothed moisture rising by >= `min_rise` within `window` s.
+
+    Returns a list of {start, peak, before, after, rise} dicts (epoch
+    seconds and moisture %), one per event.
+    """
+    if len(t) < 2:
+        return []
+    smooth = rolling_mean(t, moisture, SMOOTHING_WINDOW)
+    return _event_dicts(t, smooth, _event_spans(smooth, trailing_start(t, window), min_rise))
+
+
+# --- Reports ---
+
+BAND_COLUMNS = {
+    'moisture': ('moisture_dry_pct', 'moisture_good_pct', 'moisture_wet_pct'),
+    'temperature': ('temperature_cold_pct', 'temperature_good_pct', 'temperature_hot_pct'),
+}
+
+
+def _daily_rows(t, moisture, temperature, weights, band_codes, smooth, lo, spans):
+    """One dict per local calendar day, from the series summarize() already computed."""
+    n = len(t)
+    day = np.floor((t + _utc_offsets(t)) / 86400).astype(np.int64)
+    starts = np.flatnonzero(np.diff(day, prepend=day[:1] - 1))
+    counts = np.diff(np.append(starts, n))
+    days = len(starts)
+    day_index = np.repeat(np.arange(days), counts)
+
+    columns = {
+        'moisture_mean': np.add.reduceat(moisture, starts) / counts,
+        'moisture_min': np.minimum.reduceat(moisture, starts),
+        'moisture_max': np.maximum.reduceat(moisture, starts),
+        'temperature_mean': np.add.reduceat(temperature, starts) / counts,
+        'temperature_min': np.minimum.reduceat(temperature, starts),
+        'temperature_max': np.maximum.reduceat(temperature, starts),
+    }
+    total = np.add.reduceat(weights, starts)
+    for name, codes in band_codes.items():
+        shares = np.bincount(day_index * 3 + codes + 1, weights, minlength=days * 3).reshape(days, 3)
+        for column, values in zip(BAND_COLUMNS[name], (shares / total[:, None] * 100).T):
+            columns[column] = values
+
+    # Drying rate: mean over the samples whose rate window does not touch an irrigation event
+    begins = np.array([begin for begin, _ in spans], dtype=np.int64)
+    clear = np.searchsorted(lo, [peak for _, peak in spans], side='right')
+    marks = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(marks, begins, 1)
+    np.add.at(marks, clear, -1)
+    drying = -_rate(t, smooth, lo)
+    valid = np.isfinite(drying) & (np.cumsum(marks[:n]) == 0)
+    drying_sum = np.bincount(day_index, np.where(valid, drying, 0.0), minlength=days)
+    drying_count = np.bincount(day_index, valid, minlength=days)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['drying_rate_pct_per_hour'] = np.where(drying_count > 0, drying_sum / drying_count, np.nan)
+    events_per_day = np.bincount(day_index[begins], minlength=days)
+
+    rows = []
+    for i, first in enumerate(starts):
+        row = {'date': str(np.datetime64(int(day[first]), 'D')), 'samples': int(counts[i]),
+               'irrigation_events': int(events_per_day[i])}
+        for name, values in columns.items():
+            value = float(values[i])
+            row[name] = round(value, 2) if np.isfinite(value) else None
+        rows.append(row)
+    return rows
+
+
+def summarize(t, moisture, temperature):
+    """Daily rows, irrigation events and overall time-in-band for one sensor's history.
+
+    Rows must be time-ordered (as load() returns them). Every derived series
+    is computed once and shared between the daily and overall figures.
+    """
+    if len(t) == 0:
+        return {'samples': 0, 'days': [], 'irrigation_events': [],
+                'moisture_in_band': None, 'temperature_in_band': None}
+    weights = sample_durations(t)
+    band_codes = {'moisture': classify_moisture(moisture), 'temperature': classify_temperature(temperature)}
+    smooth = rolling_mean(t, moisture, SMOOTHING_WINDOW)
+    lo = trailing_start(t, RATE_WINDOW)
+    spans = _event_spans(smooth, lo, EVENT_MIN_RISE)
+    return {
+        'samples': int(len(t)),
+        'days': _daily_rows(t, moisture, temperature, weights, band_codes, smooth, lo, spans),
+        'irrigation_events': _event_dicts(t, smooth, spans),
+        'moisture_in_band': time_in_band(t, band_codes['moisture'], weights),
+        'temperature_in_band': time_in_band(t, band_codes['temperature'], weights),
+    }
+
+
+def daily_report(t, moisture, temperature):
+    """One summary dict per local calendar day (rows must be time-ordered)."""
+    return summarize(t, moisture, temperature)['days']
+
+
+def sensor_name(path):
+    """Hardware ID from a per-device log name (sensor_data_<ID>.csv), else the file stem."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem[len('sensor_data_'):] if stem.startswith('sensor_data_') else stem
+
+
+def fleet_report(paths, start=None, end=None):
+    """{sensor: summarize() result} for every history file in `paths`."""
+    return {sensor_name(path): summarize(*load(path, start, end)) for path in paths}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Daily soil reports from local sensor history files')
+    parser.add_argument('paths', nargs='+', help='CSV logs (rotated files are found via their index) or .bin stores')
+    parser.add_argument('--from', dest='start', help='Start time (epoch seconds or ISO-8601, local time)')
+    parser.add_argument('--to', dest='end', help='End time (exclusive)')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start = parse_time(args.start) if args.start else None
+    end = parse_time(args.end) if args.end else None
+
+    began = time.perf_counter()
+    report = fleet_report(args.paths, start, end)
+    rows = sum(sensor['samples'] for sensor in report.values())
+    logger.info(f"Analysed {rows} reading(s) from {len(args.paths)} file(s) in {time.perf_counter() - began:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
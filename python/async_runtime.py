@@ -0,0 +1,114 @@
+"""asyncio runtime for the acquisition, upload and session pipeline."""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import firestore
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """Run every device, the uploader, assignment and heartbeats on one event loop.
+
+    Serial I/O stays blocking (minimalmodbus), so each bus gets a
+    single-thread executor: transactions on a bus are serialized while
+    separate buses run in parallel. Firestore writes use the async client.
+    Sampling follows each device's PeriodicSchedule, so upload or network
+    latency never stretches the sampling period.
+
+    Assignment is driven by the session listeners: a change wakes the
+    assignment loop at once, and idle devices refresh their presence only
+    every `presence_ttl` seconds.
+    """
+
+    def __init__(self, devices, uploader, adb, announce, presence_interval=3, heartbeat_check=10,
+                 presence_ttl=240):
+        self.devices = list(devices)
+        self.uploader = uploader
+        self.adb = adb
+        self.announce = announce
+        self.presence_interval = presence_interval
+        self.presence_ttl = presence_ttl
+        self.heartbeat_check = heartbeat_check
+
+    async def run(self):
+        buses = {}
+        for device in self.devices:
+            buses.setdefault(device.config.port, []).append(device)
+        logger.info(f"Async runtime managing {len(self.devices)} sensor(s) on {len(buses)} bus(es)")
+
+        tasks = [asyncio.create_task(self.uploader.run(), name="uploader"),
+                 asyncio.create_task(self._assignment_loop(), name="assignment"),
+                 asyncio.create_task(self._heartbeat_loop(), name="heartbeat")]
+        tasks += [asyncio.create_task(self._bus_loop(port, bus_devices), name=f"bus-{port}")
+                  for port, bus_devices in buses.items()]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _bus_loop(self, port, devices):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"bus-{port}")
+        try:
+            while True:
+                now = time.monotonic()
+                due = [d for d in devices if d.assigned and d.schedule.due(now)]
+                due.sort(key=lambda d: d.schedule.deadline)
+
+                for device in due:
+                    await loop.run_in_executor(executor, device.run_cycle)
+
+                pending = [d.schedule.deadline for d in devices if d.assigned]
+                wait = min(pending) - time.monotonic() if pending else 0.5
+                await asyncio.sleep(min(max(wait, 0.0), 0.5))
+        finally:
+            for device in devices:
+                device.disconnect()
+            executor.shutdown(wait=False)
+
+    async def _assignment_loop(self):
+        """Hand sessions to idle devices and announce the rest."""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        for device in self.devices:
+            device.session_cache.add_listener(lambda data: loop.call_soon_threadsafe(wake.set))
+        while True:
+            wake.clear()
+            for device in self.devices:
+                if device.assigned:
+                    continue
+                # SessionCache.get() may fall back to a blocking read after its TTL
+                session = await loop.run_in_executor(None, device.session_cache.get)
+                if session:
+                    device.assign(session.get('userId'), session.get('fieldId'))
+                    logger.info(f"OK [{device.hardware_id}] Assigned to user {device.user_id}, field {device.field_id}")
+                elif device.session_cache.presence_due(self.presence_ttl):
+                    cache = device.session_cache
+                    if await self.announce(self.adb, device.hardware_id, refresh=cache.presence_announced):
+                        cache.mark_presence()
+            try:
+                await asyncio.wait_for(wake.wait(), self.presence_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat_loop(self):
+        """Keep sessions alive for devices whose uploads are sparse (deadband, long windows)."""
+        while True:
+            await asyncio.sleep(self.heartbeat_check)
+            for device in self.devices:
+                if not device.assigned or not self.uploader.heartbeat_due(device.hardware_id):
+                    continue
+                try:
+                    session_ref = self.adb.collection('sensor_sessions').document(device.hardware_id)
+                    await self.uploader.gateway.call_async('heartbeat', session_ref.update, {
+                        'lastHeartbeat': firestore.SERVER_TIMESTAMP
+                    })
+                    self.uploader.mark_heartbeat([device.hardware_id])
+                except Exception as e:
+                    logger.error(f"[{device.hardware_id}] Failed to update heartbeat: {e}")
@@ -0,0 +1,251 @@
+"""Benchmarks for the acquisition-to-upload hot path.
+
+Runs entirely against simulated probes and the in-memory Firestore, so it
+needs no hardware or network. Results are written as JSON so runs can be
+compared:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --only csv,upload --quick
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from csv_logger import CsvLogger
+from devices import DeviceConfig, SensorDevice, build_bus_schedulers
+from simulator import InMemoryFirestore, claim_session
+from uploader import BatchUploader
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS = ('cycle', 'bus', 'upload', 'http', 'csv')
+
+
+def _summary(samples):
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4),
+        'p50_ms': round(pct(50), 4),
+        'p99_ms': round(pct(99), 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+
+def _sim_device(index, port, latency, uploader=None, poll_interval=5.0):
+    config = DeviceConfig(f"BENCH-{index:04d}", f"{port}&latency={latency}", slave=index + 1,
+                          poll_interval=poll_interval)
+    device = SensorDevice(config, uploader=uploader)
+    device.assign('bench-user', 'bench-field')
+    return device
+
+
+def bench_cycle(cycles, latency):
+    """Wall time of SensorDevice.run_cycle (read, evaluate, publish) on one probe."""
+    device = _sim_device(0, 'sim:synthetic?bench=cycle', latency)
+    device.run_cycle()  # connect outside the measurement
+    samples = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        device.run_cycle()
+        samples.append(time.perf_counter() - start)
+    result = _summary(samples)
+    result['modbus_latency_s'] = latency
+    return result
+
+
+def bench_bus(devices_per_bus, buses, duration, latency):
+    """Samples per second per bus with every probe polled as fast as the bus allows."""
+    devices = [_sim_device(i, f"sim:synthetic?bus={i % buses}", latency, poll_interval=0.001)
+               for i in range(devices_per_bus * buses)]
+    schedulers = build_bus_schedulers(devices)
+    for scheduler in schedulers:
+        scheduler.start()
+    time.sleep(duration)
+    for scheduler in schedulers:
+        scheduler.stop()
+
+    per_bus = {}
+    for device in devices:
+        per_bus[device.config.port] = per_bus.get(device.config.port, 0) + device.schedule.ticks
+    rates = [ticks / duration for ticks in per_bus.values()]
+    return {
+        'buses': buses,
+        'devices_per_bus': devices_per_bus,
+        'modbus_latency_s': latency,
+        'samples_per_sec_per_bus': round(statistics.fmean(rates), 1),
+        'samples_per_sec_total': round(sum(rates), 1),
+    }
+
+
+def bench_upload(readings, sensors, firestore_latency):
+    """Readings per second through BatchUploader into the in-memory Firestore."""
+    db = InMemoryFirestore(latency=firestore_latency)
+    for i in range(sensors):
+        claim_session(db, f"BENCH-{i:04d}", 'bench-user', 'bench-field')
+    uploader = BatchUploader(db, max_pending=readings)
+    now = datetime.now(timezone.utc)
+
+    start = time.perf_counter()
+    uploader.start()
+    for i in range(readings):
+        uploader.submit(f"BENCH-{i % sensors:04d}", 'bench-user', 'bench-field',
+                        40.0, 21.0, 'ok', 'ok', now)
+    submitted = time.perf_counter() - start
+    while uploader.pending():
+        time.sleep(0.005)
+    uploader.stop()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'readings': readings,
+        'sensors': sensors,
+        'firestore_latency_s': firestore_latency,
+        'submit_us_per_reading': round(submitted / readings * 1e6, 3),
+        'readings_per_sec': round(readings / elapsed, 1),
+        'documents_written': db.writes,
+    }
+
+
+def bench_http(clients, requests_per_client, server):
+    """/data latency with concurrent clients against a live server."""
+    import sensor  # Flask app; imported late because it configures logging
+    logging.getLogger().setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    device = _sim_device(0, 'sim:synthetic?bench=http', 0)
+    sensor.devices[device.hardware_id] = device
+    device.run_cycle()
+
+    port = 2100 + os.getpid() % 1000
+    if server == 'waitress':
+        from waitress.server import create_server
+        httpd = create_server(sensor.app, host='127.0.0.1', port=port, threads=max(4, clients))
+        serve, shutdown = httpd.run, httpd.close
+    else:
+        from werkzeug.serving import make_server
+        httpd = make_server('127.0.0.1', port, sensor.app, threaded=True)
+        serve, shutdown = httpd.serve_forever, httpd.shutdown
+    threading.Thread(target=serve, daemon=True).start()
+    time.sleep(0.3)
+
+    url = f"http://127.0.0.1:{port}/data"
+
+    def client(_):
+        samples = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            with urllib.request.urlopen(url) as response:
+                response.read()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        samples = [s for chunk in pool.map(client, range(clients)) for s in chunk]
+    elapsed = time.perf_counter() - start
+    shutdown()
+
+    result = _summary(samples)
+    result.update({'server': server, 'clients': clients,
+                   'requests_per_sec': round(len(samples) / elapsed, 1)})
+    return result
+
+
+def bench_csv(rows):
+    """Rows per second for the buffered CsvLogger vs. open-append-close per row."""
+    directory = tempfile.mkdtemp(prefix='bench-csv-')
+    csv_logger = CsvLogger(os.path.join(directory, 'buffered.csv'), compress=False)
+    start = time.perf_counter()
+    for i in range(rows):
+        csv_logger.write(40.0 + i % 10, 21.5)
+    csv_logger.close()
+    buffered = time.perf_counter() - start
+
+    path = os.path.join(directory, 'unbuffered.csv')
+    start = time.perf_counter()
+    for i in range(rows):
+        with open(path, 'a', newline='') as f:
+            f.write(f"{datetime.now().isoformat()},{40.0 + i % 10},21.5\n")
+    unbuffered = time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'buffered_rows_per_sec': round(rows / buffered, 1),
+        'open_append_close_rows_per_sec': round(rows / unbuffered, 1),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sensor acquisition and upload pipeline')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--only', help=f"Comma-separated subset of: {','.join(BENCHMARKS)}")
+    parser.add_argument('--quick', action='store_true', help='Smaller workloads for a fast sanity run')
+    parser.add_argument('--modbus-latency', type=float, default=0.0,
+                        help='Simulated Modbus transaction time in seconds (default: 0, pure overhead)')
+    parser.add_argument('--firestore-latency', type=float, default=0.0,
+                        help='Simulated Firestore round trip in seconds (default: 0)')
+    parser.add_argument('--http-server', choices=['dev', 'waitress'], default='dev')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    scale = 0.1 if args.quick else 1.0
+
+    runners = {
+        'cycle': lambda: bench_cycle(int(2000 * scale), args.modbus_latency),
+        'bus': lambda: bench_bus(8, 2, 1.0 if args.quick else 5.0, args.modbus_latency),
+        'upload': lambda: bench_upload(int(20000 * scale), 20, args.firestore_latency),
+        'http': lambda: bench_http(8, int(200 * scale), args.http_server),
+        'csv': lambda: bench_csv(int(50000 * scale)),
+    }
+
+    results = {}
+    for name in selected:
+        if name not in runners:
+            parser.error(f"unknown benchmark {name!r}")
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = runners[name]()
+        print(json.dumps(results[name]), file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
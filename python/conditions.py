@@ -0,0 +1,41 @@
+"""Agronomic thresholds used to classify soil readings."""
+
+# Soil moisture (%) band considered healthy
+MOISTURE_DRY = 30
+MOISTURE_WET = 60
+
+# Soil temperature (°C) band considered healthy
+TEMP_COLD = 10
+TEMP_HOT = 35
+
+# Band codes: below, inside or above the healthy band (also used by analytics)
+LOW, GOOD, HIGH = -1, 0, 1
+
+MOISTURE_STATUS = {
+    LOW: "🌵 Too Dry — Irrigation Needed!",
+    GOOD: "✅ Moisture Good",
+    HIGH: "💧 Too Wet — Check Drainage",
+}
+
+TEMP_STATUS = {
+    LOW: "❄️ Too Cold — Poor Growth",
+    GOOD: "🌿 Temperature Good",
+    HIGH: "🔥 Too Hot — Stress Risk",
+}
+
+
+def band(value, low, high):
+    """LOW, GOOD or HIGH for one value against the inclusive band [low, high]."""
+    if value < low:
+        return LOW
+    elif low <= value <= high:
+        return GOOD
+    else:
+        return HIGH
+
+
+def evaluate_conditions(moisture, temperature):
+    """Return status messages based on moisture and temperature levels."""
+    moisture_status = MOISTURE_STATUS[band(moisture, MOISTURE_DRY, MOISTURE_WET)]
+    temp_status = TEMP_STATUS[band(temperature, TEMP_COLD, TEMP_HOT)]
+    return moisture_status, temp_status
@@ -0,0 +1,219 @@
+"""Buffered, rotating CSV logging of sensor readings."""
+import csv
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADER = ['timestamp', 'moisture', 'temperature']
+
+
+class CsvLogger:
+    """Append readings to a CSV file through an in-memory buffer.
+
+    The file stays open; buffered rows are written every `flush_interval`
+    seconds (or when `max_buffered` rows pile up), optionally followed by an
+    fsync. The active file is rotated when it exceeds `max_bytes` or when
+    the day changes. Rotated files can be gzip-compressed in the background,
+    and `<name>.index.json` records each rotated file's time range so old
+    data can be located without opening every file.
+    """
+
+    def __init__(self, path, flush_interval=30, fsync=False, max_bytes=5 * 1024 * 1024,
+                 rotate_daily=True, compress=True, max_buffered=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.max_buffered = max_buffered
+
+        base, _ = os.path.splitext(path)
+        self.index_path = f"{base}.index.json"
+        self._lock = threading.Lock()
+        # Separate from _lock: rotation (under _lock) and compressor threads both update the index
+        self._index_lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._first_ts = None
+        self._last_ts = None
+        self._rows = 0
+        self._compressors = []
+        self._open()
+
+    def _open(self):
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if not is_new:
+            self._first_ts, self._last_ts, self._rows = _scan_existing(self.path)
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if is_new:
+            self._writer.writerow(CSV_HEADER)
+            self._file.flush()
+            logger.info(f"Created CSV file: {self.path}")
+
+    def write(self, moisture, temperature, timestamp=None):
+        """Buffer one reading; flushes to disk when the interval has passed."""
+        timestamp = timestamp or datetime.now()
+        with self._lock:
+            self._buffer.append((timestamp, moisture, temperature))
+            if len(self._buffer) >= self.max_buffered or \
+                    time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+
+        for timestamp, moisture, temperature in rows:
+            if self._should_rotate(timestamp):
+                self._rotate_locked()
+            self._writer.writerow([timestamp.isoformat(), moisture, temperature])
+            if self._first_ts is None:
+                self._first_ts = timestamp
+            self._last_ts = timestamp
+            self._rows += 1
+
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _should_rotate(self, timestamp):
+        if self._rows == 0:
+            return False
+        if self.rotate_daily and self._first_ts and timestamp.date() != self._first_ts.date():
+            return True
+        return self.max_bytes and self._file.tell() >= self.max_bytes
+
+    def _rotate_locked(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{self._first_ts.strftime('%Y%m%dT%H%M%S')}{ext}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            rotated = f"{base}-{self._first_ts.strftime('%Y%m%dT%H%M%S')}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, rotated)
+
+        entry = {
+            'file': os.path.basename(rotated),
+            'start': self._first_ts.isoformat(),
+            'end': self._last_ts.isoformat(),
+            'rows': self._rows,
+        }
+        logger.info(f"Rotated {self.path} -> {rotated} ({self._rows} rows)")
+
+        self._first_ts = None
+        self._last_ts = None
+        self._rows = 0
+        self._file = open(self.path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CSV_HEADER)
+
+        # Indexed right away so /history sees the rows while compression runs
+        self._update_index(lambda index: index.append(entry))
+        if self.compress:
+            thread = threading.Thread(target=self._compress, args=(rotated,),
+                                      name="csv-compress", daemon=True)
+            thread.start()
+            self._compressors = [t for t in self._compressors if t.is_alive()] + [thread]
+
+    def _compress(self, rotated):
+        try:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        except OSError as e:
+            logger.error(f"Failed to compress {rotated}: {e}")
+            return
+        name = os.path.basename(rotated)
+
+        def point_to_gz(index):
+            for entry in index:
+                if entry['file'] == name:
+                    entry['file'] = name + '.gz'
+
+        # Switch the index to the .gz before the plain file disappears
+        self._update_index(point_to_gz)
+        try:
+            os.remove(rotated)
+        except OSError as e:
+            logger.error(f"Failed to remove {rotated} after compression: {e}")
+
+    def _update_index(self, change):
+        """Apply `change(entries)` to the index file and write it back atomically."""
+        with self._index_lock:
+            index = load_index(self.index_path)
+            change(index)
+            index.sort(key=lambda e: e['start'])
+            tmp_path = f"{self.index_path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'files': index}, f, indent=2)
+                os.replace(tmp_path, self.index_path)
+            except OSError as e:
+                logger.error(f"Failed to update CSV index {self.index_path}: {e}")
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            compressors, self._compressors = self._compressors, []
+        # Let in-flight compression finish so the index stays complete
+        for thread in compressors:
+            thread.join()
+
+
+def load_index(index_path):
+    """Rotated-file entries ({file, start, end, rows}) from an index file."""
+    if not os.path.exists(index_path):
+        return []
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', [])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable CSV index {index_path}: {e}")
+        return []
+
+
+def _scan_existing(path):
+    """First/last timestamp and row count of an existing CSV file."""
+    first_ts = last_ts = None
+    rows = 0
+    try:
+        with open(path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # header
+            for row in reader:
+                if not row:
+                    continue
+                try:
+                    ts = datetime.fromisoformat(row[0])
+                except ValueError:
+                    continue
+                if first_ts is None:
+                    first_ts = ts
+                last_ts = ts
+                rows += 1
+    except OSError as e:
+        logger.warning(f"Could not scan existing CSV {path}: {e}")
+    return first_ts, last_ts, rows
@@ -0,0 +1,59 @@
+"""Report-by-exception filtering of uploads."""
+
+# Suppressed cycles do not touch the faminga_sensors/{id} snapshot, and the
+# app (dashboard_provider.dart) shows a sensor offline once that snapshot is
+# more than 60 s old. The keepalive must land before then, allowing for one
+# poll interval and a slow commit.
+MAX_KEEPALIVE = 45
+
+
+class Deadband:
+    """Decide whether a reading differs enough from the last uploaded one.
+
+    `limits` maps a channel name to {"abs": x, "pct": y}; a value is a
+    change when it moves more than `abs` units or more than `pct` percent
+    of the last reported value. A channel without limits reports any
+    change. A reading is always reported after `keepalive` seconds.
+    """
+
+    def __init__(self, limits=None, keepalive=MAX_KEEPALIVE):
+        self.limits = limits or {}
+        self.keepalive = min(keepalive, MAX_KEEPALIVE)
+        self._last_values = None
+        self._last_time = None
+        self.suppressed = 0
+
+    def _changed(self, channel, value, last):
+        limit = self.limits.get(channel) or {}
+        if limit.get('abs') is None and limit.get('pct') is None:
+            return value != last
+        delta = abs(value - last)
+        if limit.get('abs') is not None and delta > limit['abs']:
+            return True
+        if limit.get('pct') is not None and delta > abs(last) * limit['pct'] / 100.0:
+            return True
+        return False
+
+    def should_report(self, values, now):
+        """True if `values` (channel -> value) must be uploaded at monotonic time `now`."""
+        if self._last_values is None or now - self._last_time >= self.keepalive:
+            return True
+        for channel, value in values.items():
+            last = self._last_values.get(channel)
+            if last is None:
+                return True
+            if isinstance(value, str) or isinstance(last, str):
+                if value != last:
+                    return True
+            elif self._changed(channel, value, last):
+                return True
+        self.suppressed += 1
+        return False
+
+    def mark_reported(self, values, now):
+        self._last_values = dict(values)
+        self._last_time = now
+
+    def reset(self):
+        self._last_values = None
+        self._last_time = None
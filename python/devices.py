@@ -0,0 +1,508 @@
+"""Per-device Modbus acquisition and per-bus transaction scheduling."""
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import minimalmodbus
+import serial
+
+import discovery
+from aggregation import MAX_UPLOAD_INTERVAL, Aggregator
+from conditions import evaluate_conditions
+from deadband import MAX_KEEPALIVE, Deadband
+from health import OFFLINE, STATE_CODES, CircuitBreaker
+from scheduler import PeriodicSchedule
+from snapshot import SnapshotHolder
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_CONSECUTIVE_ERRORS = 3
+
+
+@dataclass
+class DeviceConfig:
+    """Static settings for one probe on an RS485 bus."""
+    hardware_id: str
+    port: str
+    slave: int = 1
+    baudrate: int = 9600
+    timeout: float = 1.0
+    poll_interval: float = 5.0
+    # Seconds per uploaded aggregate (min/max/mean/stddev, max MAX_UPLOAD_INTERVAL);
+    # 0 uploads every sample. Local logs always get every sample.
+    upload_interval: float = 0
+    # Report-by-exception: {"moisture": {"abs": 0.5, "pct": 2}, ...}; None uploads everything
+    deadband: dict = None
+    keepalive: float = MAX_KEEPALIVE
+    csv_file: str = None
+    # One read_registers(0, 2) transaction instead of two single-register reads
+    block_read: bool = True
+    # Keep the serial port open between cycles instead of reopening per call
+    persistent: bool = False
+    # USB adapter serial number, used to follow the probe if it is re-plugged
+    serial_number: str = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            hardware_id=data['hardwareId'],
+            port=data['port'],
+            slave=int(data.get('slave', 1)),
+            baudrate=int(data.get('baudrate', 9600)),
+            timeout=float(data.get('timeout', 1.0)),
+            poll_interval=float(data.get('pollInterval', 5.0)),
+            upload_interval=float(data.get('uploadInterval', 0)),
+            deadband=data.get('deadband'),
+            keepalive=float(data.get('keepalive', MAX_KEEPALIVE)),
+            csv_file=data.get('csvFile'),
+            block_read=bool(data.get('blockRead', True)),
+            persistent=bool(data.get('persistent', False)),
+            serial_number=data.get('serialNumber'),
+        )
+
+
+def load_device_configs(path):
+    """Read a devices JSON file: {"devices": [{"hardwareId": ..., "port": ...}, ...]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    configs = [DeviceConfig.from_dict(d) for d in data.get('devices', [])]
+
+    seen = set()
+    for config in configs:
+        if config.hardware_id in seen:
+            raise ValueError(f"Duplicate hardwareId in {path}: {config.hardware_id}")
+        seen.add(config.hardware_id)
+    return configs
+
+
+def new_state(hardware_id=None):
+    """Fresh dashboard state holder for one device."""
+    return SnapshotHolder(
+        hardwareId=hardware_id,
+        moisture=0,
+        temperature=0,
+        timestamp=None,
+        status="initializing",
+        moisture_status="",
+        temp_status=""
+    )
+
+
+def open_instrument(port, slave):
+    """A minimalmodbus Instrument, or a SimulatedInstrument for ``sim:`` ports."""
+    if port.startswith('sim:'):
+        from simulator import open_simulated
+        return open_simulated(port, slave)
+    return minimalmodbus.Instrument(port, slave)
+
+
+class SensorDevice:
+    """One soil probe with its own session, state and upload stream.
+
+    `poll()` runs a single acquisition cycle and returns how long to wait
+    before the next one, so the same object can be driven by the legacy
+    single-sensor loop or by a BusScheduler shared with other probes.
+    """
+
+    def __init__(self, config, uploader=None, session_cache=None, csv_log=None,
+                 state=None, history=None, on_update=None):
+        self.config = config
+        self.uploader = uploader
+        self.session_cache = session_cache
+        self.csv_log = csv_log
+        self.history = history
+        # Called with (hardware_id, Snapshot) whenever the state changes
+        self.on_update = on_update
+        # SnapshotHolder: HTTP handlers read state.current without locking
+        self.state = state if state is not None else new_state()
+        self.state.update(hardwareId=config.hardware_id)
+
+        self.active = True
+        self.user_id = None
+        self.field_id = None
+        self.instrument = None
+        self.instrument_lock = threading.Lock()
+        self.breaker = CircuitBreaker(f"[{config.hardware_id}]", threshold=MAX_CONSECUTIVE_ERRORS)
+        metrics.DEVICE_STATE.labels(config.hardware_id).set_function(
+            lambda: STATE_CODES[self.breaker.state])
+        self.last_success_time = None
+        self.schedule = PeriodicSchedule(config.poll_interval, name=f"[{config.hardware_id}] Sampling")
+        self.aggregator = None
+        if config.upload_interval and min(config.upload_interval, MAX_UPLOAD_INTERVAL) > config.poll_interval:
+            self.aggregator = Aggregator(config.poll_interval, config.upload_interval)
+        self.deadband = None
+        if config.deadband is not None:
+            self.deadband = Deadband(config.deadband, config.keepalive)
+
+    @property
+    def hardware_id(self):
+        return self.config.hardware_id
+
+    @property
+    def assigned(self):
+        return self.user_id is not None
+
+    def assign(self, user_id, field_id):
+        self.user_id = user_id
+        self.field_id = field_id
+        self.schedule.reset()
+        self.set_status("initializing")
+
+    def unassign(self):
+        self.user_id = None
+        self.field_id = None
+        if self.aggregator:
+            self.aggregator.reset()
+        if self.deadband:
+            self.deadband.reset()
+
+    def set_status(self, status):
+        self._publish_state(status=status)
+
+    def _publish_state(self, **changes):
+        snapshot = self.state.update(**changes)
+        if self.on_update:
+            self.on_update(self.hardware_id, snapshot)
+
+    def connect(self):
+        """Open (or reopen) the Modbus instrument for this device."""
+        try:
+            with self.instrument_lock:
+                self._close_instrument()
+
+                instrument = open_instrument(self.config.port, self.config.slave)
+                instrument.serial.baudrate = self.config.baudrate
+                instrument.serial.bytesize = 8
+                instrument.serial.parity = serial.PARITY_NONE
+                instrument.serial.stopbits = 1
+                instrument.serial.timeout = self.config.timeout
+                # Closing between calls lets other programs share the port;
+                # persistent mode skips the reopen cost on dedicated buses.
+                instrument.close_port_after_each_call = not self.config.persistent
+                instrument.clear_buffers_before_each_transaction = True
+                self.instrument = instrument
+
+            metrics.RECONNECTS.labels(self.hardware_id).inc()
+            if self.config.serial_number is None and not self.config.port.startswith('sim:'):
+                self.config.serial_number = discovery.port_serial_number(self.config.port)
+            logger.info(f"[{self.hardware_id}] Modbus sensor initialized on {self.config.port} (slave {self.config.slave})")
+            return True
+
+        except Exception as e:
+            logger.error(f"[{self.hardware_id}] Failed to initialize sensor: {e}")
+            self.instrument = None
+            return False
+
+    def disconnect(self):
+        with self.instrument_lock:
+            self._close_instrument()
+
+    def _close_instrument(self):
+        if self.instrument is None:
+            return
+        try:
+            if hasattr(self.instrument, 'serial') and self.instrument.serial:
+                if self.instrument.serial.is_open:
+                    self.instrument.serial.close()
+                time.sleep(0.5)  # Give the port time to close
+        except Exception as e:
+            logger.warning(f"[{self.hardware_id}] Error closing previous connection: {e}")
+        self.instrument = None
+
+    def read(self):
+        """Read moisture (%) and temperature (°C) from holding registers 0 & 1."""
+        with self.instrument_lock, metrics.MODBUS_READ_SECONDS.labels(self.hardware_id).time():
+            if self.config.block_read:
+                moisture_raw, temp_raw = self.instrument.read_registers(0, 2, 3)
+            else:
+                # Legacy probes that reject multi-register reads
+                moisture_raw = self.instrument.read_register(0, 0, 3)
+                time.sleep(0.1)  # Small delay between reads
+                temp_raw = self.instrument.read_register(1, 0, 3)
+        return moisture_raw / 10.0, temp_raw / 10.0
+
+    def prime(self):
+        """One read outside any session, published with status "waiting".
+
+        Lets the dashboard show a value right after startup while Firebase
+        and the session are still coming up. Nothing is logged or uploaded.
+        """
+        if self.instrument is None and not self.connect():
+            return False
+        try:
+            moisture, temperature = self.read()
+        except (OSError, ValueError, minimalmodbus.ModbusException) as e:
+            logger.warning(f"[{self.hardware_id}] Startup read failed: {e}")
+            return False
+        moisture_status, temp_status = evaluate_conditions(moisture, temperature)
+        self._publish_state(
+            moisture=round(moisture, 1),
+            temperature=round(temperature, 1),
+            timestamp=time.time(),
+            status="waiting",
+            moisture_status=moisture_status,
+            temp_status=temp_status
+        )
+        return True
+
+    def session_valid(self):
+        """Check the cached session is still live and owned by our user."""
+        if self.session_cache is None:
+            return True
+        session = self.session_cache.get()
+        if session is None:
+            return False
+        if session.get('userId') != self.user_id:
+            logger.error(f"[{self.hardware_id}] Session user mismatch: expected {self.user_id}, got {session.get('userId')}")
+            return False
+        return True
+
+    def _record_error(self, reset_port):
+        """Feed a failed read to the breaker; returns the delay before the next cycle."""
+        delay = self.breaker.record_failure()
+        if self.breaker.state == OFFLINE:
+            logger.error(f"[{self.hardware_id}] Sensor offline, next attempt in {delay:.0f}s")
+            if reset_port:
+                self.disconnect()
+            else:
+                self.instrument = None
+            self.set_status("offline")
+        else:
+            self.set_status("error")
+        return delay
+
+    def probe(self):
+        """One short single-register read; True if the probe answers.
+
+        minimalmodbus shares one Serial object per port name, so the probe's
+        baudrate and timeout are restored afterwards for the other devices on
+        the bus, and a persistent bus is left open.
+        """
+        port = None
+        try:
+            instrument = open_instrument(self.config.port, self.config.slave)
+            port = instrument.serial
+            saved = port.baudrate, port.timeout
+            try:
+                port.baudrate = self.config.baudrate
+                port.timeout = discovery.PROBE_TIMEOUT
+                instrument.read_register(0, 0, 3)
+                return True
+            finally:
+                port.baudrate, port.timeout = saved
+        except (OSError, ValueError, minimalmodbus.ModbusException):
+            return False
+        finally:
+            if port is not None and not self.config.persistent:
+                port.close()
+
+    def _follow_replug(self):
+        """If the USB adapter reappeared under another port name, switch to it."""
+        if self.config.port.startswith('sim:') or not self.config.serial_number:
+            return False
+        new_port = discovery.find_port_by_serial(self.config.serial_number)
+        if new_port is None or new_port == self.config.port:
+            return False
+        logger.warning(f"[{self.hardware_id}] Adapter {self.config.serial_number} re-plugged: "
+                       f"{self.config.port} -> {new_port}")
+        self.config.port = new_port
+        return True
+
+    def run_cycle(self):
+        """Run poll() on the device's schedule and book the next tick.
+
+        Returns False when the session ended and the device was unassigned.
+        """
+        self.schedule.start_tick()
+        try:
+            delay = self.poll()
+        except Exception as e:
+            logger.error(f"[{self.hardware_id}] Unexpected error: {e}", exc_info=True)
+            self.set_status("error")
+            delay = 5
+
+        if delay is None:
+            # Session ended: wait for the assignment loop to hand it back
+            self.unassign()
+            self.disconnect()
+            return False
+
+        self.schedule.finish_tick(delay)
+        return True
+
+    def poll(self):
+        """Run one acquisition cycle.
+
+        Returns the number of seconds to wait before the next cycle, or
+        None when the session has ended and the device should stop.
+        """
+        if not self.active:
+            self.set_status("stopped")
+            return self.config.poll_interval
+
+        # SESSION VALIDATION: Check if session is still valid
+        with metrics.SESSION_CHECK_SECONDS.labels(self.hardware_id).time():
+            session_ok = self.session_valid()
+        if not session_ok:
+            logger.error(f"[{self.hardware_id}] ERR Session lost or invalid - stopping sensor loop")
+            self.set_status("session_lost")
+            return None
+
+        if self.instrument is None:
+            if self.breaker.state == OFFLINE:
+                # Cheap probe first; a full reinit only once the sensor answers again
+                if not self.probe() and not (self._follow_replug() and self.probe()):
+                    self.set_status("offline")
+                    return self.breaker.record_failure()
+                self.breaker.half_open()
+            logger.info(f"[{self.hardware_id}] Initializing sensor connection on {self.config.port}...")
+            if not self.connect():
+                self.set_status("error")
+                return self.breaker.record_failure()
+            time.sleep(getattr(self.instrument, 'settle_time', 1))  # Give sensor time to stabilize
+
+        try:
+            moisture, temperature = self.read()
+        # minimalmodbus exceptions subclass OSError, so they must be caught first
+        except minimalmodbus.NoResponseError:
+            metrics.MODBUS_ERRORS.labels(self.hardware_id, 'no_response').inc()
+            logger.error(f"[{self.hardware_id}] No response from sensor ({self.breaker.failures + 1}/{MAX_CONSECUTIVE_ERRORS})")
+            return self._record_error(reset_port=False)
+        except minimalmodbus.InvalidResponseError as e:
+            metrics.MODBUS_ERRORS.labels(self.hardware_id, 'invalid_response').inc()
+            logger.error(f"[{self.hardware_id}] Invalid response: {e}")
+            return self._record_error(reset_port=False)
+        except (serial.SerialException, PermissionError, OSError) as e:
+            metrics.MODBUS_ERRORS.labels(self.hardware_id, 'serial').inc()
+            logger.error(f"[{self.hardware_id}] Communication error ({self.breaker.failures + 1}/{MAX_CONSECUTIVE_ERRORS}): {e}")
+            return self._record_error(reset_port=True)
+
+        # Reset error counter on successful read
+        metrics.READINGS.labels(self.hardware_id).inc()
+        self.breaker.record_success()
+        self.last_success_time = time.time()
+
+        moisture_status, temp_status = evaluate_conditions(moisture, temperature)
+
+        self._publish_state(
+            moisture=round(moisture, 1),
+            temperature=round(temperature, 1),
+            timestamp=self.last_success_time,
+            status="active",
+            moisture_status=moisture_status,
+            temp_status=temp_status
+        )
+
+        # Local history keeps every raw sample; only the upload is aggregated
+        self._log_locally(moisture, temperature)
+
+        if self.aggregator is None:
+            self._publish(moisture, temperature, moisture_status, temp_status)
+            logger.info(f"[{self.hardware_id}] Read: {moisture:.1f}% moisture, {temperature:.1f}°C")
+        else:
+            logger.debug(f"[{self.hardware_id}] Sample: {moisture:.1f}% moisture, {temperature:.1f}°C")
+            now = time.monotonic()
+            self.aggregator.add(moisture, temperature, now)
+            if self.aggregator.due(now):
+                summary = self.aggregator.flush(now)
+                mean_moisture = summary['moisture']['mean']
+                mean_temperature = summary['temperature']['mean']
+                self._publish(mean_moisture, mean_temperature,
+                              *evaluate_conditions(mean_moisture, mean_temperature), stats=summary)
+                logger.info(f"[{self.hardware_id}] Aggregate of {summary['sampleCount']} samples: "
+                            f"{mean_moisture:.1f}% moisture, {mean_temperature:.1f}°C")
+
+        return self.config.poll_interval
+
+    def _log_locally(self, moisture, temperature):
+        """Append one raw sample to the CSV log and the history store."""
+        if self.csv_log:
+            self.csv_log(moisture, temperature)
+        if self.history:
+            try:
+                self.history.append(moisture, temperature)
+            except OSError as e:
+                logger.error(f"[{self.hardware_id}] Failed to write history: {e}")
+
+    def _publish(self, moisture, temperature, moisture_status, temp_status, stats=None):
+        """Send one reading (or window aggregate) to the uploader."""
+        if not (self.uploader and self.user_id):
+            return
+
+        if self.deadband:
+            values = {
+                'moisture': round(moisture, 1),
+                'temperature': round(temperature, 1),
+                'moisture_status': moisture_status,
+                'temp_status': temp_status,
+            }
+            now = time.monotonic()
+            if not self.deadband.should_report(values, now):
+                logger.debug(f"[{self.hardware_id}] Unchanged within deadband, upload suppressed")
+                return
+            self.deadband.mark_reported(values, now)
+
+        # Hand off to the upload stage (snapshot + history + heartbeat in one batch)
+        self.uploader.submit(
+            self.hardware_id, self.user_id, self.field_id,
+            round(moisture, 1), round(temperature, 1),
+            moisture_status, temp_status,
+            datetime.now(timezone.utc),
+            stats=stats
+        )
+        if self.session_cache is not None:
+            # The heartbeat rides on this reading, even if it only lands after an outage
+            self.session_cache.note_heartbeat()
+
+
+class BusScheduler:
+    """Serialize Modbus transactions for all devices sharing one serial port.
+
+    Each bus gets its own thread, so separate ports are polled in parallel
+    while devices on the same RS485 line never talk over each other.
+    """
+
+    def __init__(self, port, devices):
+        self.port = port
+        self.devices = list(devices)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"bus-{self.port}", daemon=True)
+        self._thread.start()
+        logger.info(f"Bus scheduler started on {self.port} with {len(self.devices)} device(s)")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        for device in self.devices:
+            device.disconnect()
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due = [d for d in self.devices if d.assigned and d.schedule.due(now)]
+            due.sort(key=lambda d: d.schedule.deadline)
+
+            for device in due:
+                if self._stop.is_set():
+                    break
+                device.run_cycle()
+
+            pending = [d.schedule.deadline for d in self.devices if d.assigned]
+            wait = min(pending) - time.monotonic() if pending else 0.5
+            self._stop.wait(min(max(wait, 0.0), 0.5))
+
+
+def build_bus_schedulers(devices):
+    """Group devices by serial port, one scheduler per bus."""
+    buses = {}
+    for device in devices:
+        buses.setdefault(device.config.port, []).append(device)
+    return [BusScheduler(port, bus_devices) for port, bus_devices in buses.items()]
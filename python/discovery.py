@@ -0,0 +1,154 @@
+"""Parallel Modbus sensor discovery across serial ports."""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import minimalmodbus
+import serial.tools.list_ports
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLAVES = (1,)
+DEFAULT_BAUDRATES = (9600,)
+PROBE_TIMEOUT = 0.5
+
+
+def is_usb_serial(port_info):
+    """True for the CH340 / generic USB-Serial adapters our probes use."""
+    description = (port_info.description or "").upper()
+    return "USB-SERIAL" in description or "CH340" in description or "USB SERIAL" in description
+
+
+def port_hardware_id(port_info, slave=1):
+    """Stable Hardware ID for a probe behind a USB adapter (slave suffix if not 1)."""
+    if port_info.serial_number:
+        hardware_id = f"FAMINGA_{port_info.serial_number}"
+    else:
+        # Fallback if no serial number (common with cheap clones)
+        hardware_id = f"FAMINGA_{port_info.device.replace('/', '_').replace('COM', '')}"
+    return hardware_id if slave == 1 else f"{hardware_id}_S{slave}"
+
+
+def port_serial_number(port):
+    """USB serial number of the adapter at `port`, or None."""
+    for port_info in serial.tools.list_ports.comports():
+        if port_info.device == port:
+            return port_info.serial_number
+    return None
+
+
+def find_port_by_serial(serial_number):
+    """Current device path of the USB adapter with this serial number, or None."""
+    if not serial_number:
+        return None
+    for port_info in serial.tools.list_ports.comports():
+        if port_info.serial_number == serial_number:
+            return port_info.device
+    return None
+
+
+def list_candidate_ports():
+    # Skip bluetooth ports often named like this
+    return [p for p in serial.tools.list_ports.comports() if "Bluetooth" not in (p.description or "")]
+
+
+def probe(port, slave, baudrate, timeout=PROBE_TIMEOUT):
+    """Try one register read; True if a sensor answers at this address."""
+    try:
+        instrument = minimalmodbus.Instrument(port, slave, close_port_after_each_call=True)
+        instrument.serial.baudrate = baudrate
+        instrument.serial.timeout = timeout
+        instrument.read_register(0, 0, 3)
+        return True
+    except (OSError, ValueError, minimalmodbus.ModbusException):
+        return False
+
+
+def scan_port(port_info, slaves, baudrates, timeout=PROBE_TIMEOUT):
+    """Probe every (baudrate, slave) pair on one port, sequentially (one bus)."""
+    found = []
+    for baudrate in baudrates:
+        for slave in slaves:
+            logger.debug(f"Scanning {port_info.device} slave {slave} @ {baudrate}...")
+            if probe(port_info.device, slave, baudrate, timeout):
+                logger.info(f"OK Found sensor on {port_info.device} (slave {slave} @ {baudrate} baud)")
+                found.append({
+                    'hardwareId': port_hardware_id(port_info, slave),
+                    'port': port_info.device,
+                    'slave': slave,
+                    'baudrate': baudrate,
+                    'serialNumber': port_info.serial_number,
+                })
+        if found:
+            break  # A bus runs at one baudrate; no need to try the others
+    return found
+
+
+def discover(slaves=DEFAULT_SLAVES, baudrates=DEFAULT_BAUDRATES, timeout=PROBE_TIMEOUT):
+    """Probe all ports at the same time, one worker per port.
+
+    Returns the full inventory as a list of dicts with hardwareId, port,
+    slave, baudrate and serialNumber (usable as a --devices file entry).
+    """
+    ports = list_candidate_ports()
+    if not ports:
+        return []
+
+    with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="discover") as pool:
+        results = pool.map(lambda p: scan_port(p, slaves, baudrates, timeout), ports)
+        return [entry for port_entries in results for entry in port_entries]
+
+
+def verify(entries, timeout=PROBE_TIMEOUT):
+    """Re-probe known (port, slave, baudrate) entries; returns those still answering."""
+    by_port = {}
+    for entry in entries:
+        by_port.setdefault(entry['port'], []).append(entry)
+    if not by_port:
+        return []
+
+    def verify_port(port_entries):
+        return [e for e in port_entries if probe(e['port'], e['slave'], e['baudrate'], timeout)]
+
+    with ThreadPoolExecutor(max_workers=len(by_port), thread_name_prefix="verify") as pool:
+        results = pool.map(verify_port, by_port.values())
+        return [entry for port_entries in results for entry in port_entries]
+
+
+def load_inventory(path):
+    """Last-known inventory from disk, or [] if missing/unreadable."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('devices', [])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable port cache {path}: {e}")
+        return []
+
+
+def save_inventory(path, entries):
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updatedAt': datetime.now().isoformat(), 'devices': entries}, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to save port cache {path}: {e}")
+
+
+def parse_int_range(text):
+    """Parse "1-4,7" into [1, 2, 3, 4, 7]."""
+    values = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            values.extend(range(int(start), int(end) + 1))
+        else:
+            values.append(int(part))
+    return values
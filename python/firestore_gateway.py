@@ -0,0 +1,193 @@
+"""Central Firestore access: per-call deadlines, bounded retries and offline fast-fail."""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from google.api_core import exceptions as gexc
+from google.auth import exceptions as auth_exceptions
+
+import metrics
+from health import HEALTHY, OFFLINE, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Failures that say nothing about the request itself: the same call may succeed if resent
+TRANSIENT_ERRORS = (
+    gexc.ServiceUnavailable,
+    gexc.DeadlineExceeded,
+    gexc.InternalServerError,
+    gexc.TooManyRequests,
+    gexc.Aborted,
+    gexc.Unknown,
+    gexc.RetryError,
+    auth_exceptions.TransportError,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Document read by the connectivity probe (a missing document is a valid answer)
+PROBE_COLLECTION = '_health'
+PROBE_DOCUMENT = 'probe'
+
+# Recent latencies kept per operation for the p50/p99 summary
+LATENCY_WINDOW = 512
+
+
+class FirestoreOffline(Exception):
+    """Raised instead of calling Firestore while the link is considered down."""
+
+
+class FirestoreGateway:
+    """Every Firestore round trip of the service goes through `call()` / `call_async()`.
+
+    Each attempt gets an explicit `timeout` and the client library's own
+    retry policy is disabled, so one call costs at most `attempts` tries
+    plus short jittered pauses. Only transient errors are retried.
+
+    When calls keep failing the gateway goes offline: calls raise
+    FirestoreOffline at once instead of waiting out their deadlines. A
+    single-document read with `probe_timeout` is attempted on the first call
+    after each backoff period (5 s doubling to 60 s); the gateway is back
+    online as soon as one probe answers.
+
+    `db` must be the synchronous client; async callers pass their own
+    coroutine functions and share the same offline state.
+    """
+
+    def __init__(self, db, timeout=10.0, attempts=3, retry_backoff=0.5, max_retry_backoff=4.0,
+                 probe_timeout=3.0, failure_threshold=2, rng=None):
+        self.db = db
+        self.timeout = timeout
+        self.attempts = attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.probe_timeout = probe_timeout
+        self.rng = rng or random.Random()
+        self.breaker = CircuitBreaker('Firestore', threshold=failure_threshold,
+                                      base_backoff=5.0, max_backoff=60.0, rng=self.rng)
+        self._lock = threading.Lock()
+        self._next_probe = 0.0
+        self._probing = False
+        self._latencies = {}
+
+    @property
+    def online(self):
+        return self.breaker.state != OFFLINE
+
+    # --- Calls ---
+
+    def call(self, op, fn, *args, timeout=None, attempts=None, **kwargs):
+        """Run `fn(*args, retry=None, timeout=..., **kwargs)` under the gateway policy."""
+        if self._admit(op):
+            self._finish_probe(self._probe())
+        timeout = timeout or self.timeout
+        attempts = attempts or self.attempts
+        for attempt in range(1, attempts + 1):
+            start = time.perf_counter()
+            try:
+                with metrics.firestore_call(op):
+                    result = fn(*args, retry=None, timeout=timeout, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if not self._retry_or_fail(op, attempt, attempts, e):
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            except Exception:
+                self._reached(op, time.perf_counter() - start)
+                raise
+            self._reached(op, time.perf_counter() - start)
+            return result
+
+    async def call_async(self, op, fn, *args, timeout=None, attempts=None, **kwargs):
+        """`call()` for coroutine functions of the async client."""
+        if self._admit(op):
+            self._finish_probe(await asyncio.to_thread(self._probe))
+        timeout = timeout or self.timeout
+        attempts = attempts or self.attempts
+        for attempt in range(1, attempts + 1):
+            start = time.perf_counter()
+            try:
+                with metrics.firestore_call(op):
+                    result = await fn(*args, retry=None, timeout=timeout, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if not self._retry_or_fail(op, attempt, attempts, e):
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            except Exception:
+                self._reached(op, time.perf_counter() - start)
+                raise
+            self._reached(op, time.perf_counter() - start)
+            return result
+
+    # --- Policy ---
+
+    def _admit(self, op):
+        """Let the call through; True if the caller must run the probe first."""
+        with self._lock:
+            if self.breaker.state != OFFLINE:
+                return False
+            if not self._probing and time.monotonic() >= self._next_probe:
+                self._probing = True
+                return True
+        metrics.FIRESTORE_SKIPPED.labels(op).inc()
+        raise FirestoreOffline(f"Firestore offline, skipped {op}")
+
+    def _probe(self):
+        try:
+            self.db.collection(PROBE_COLLECTION).document(PROBE_DOCUMENT).get(
+                retry=None, timeout=self.probe_timeout)
+            return True
+        except Exception as e:
+            logger.debug(f"Firestore probe failed: {e}")
+            return False
+
+    def _finish_probe(self, ok):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.breaker.record_success()
+                return
+            self._next_probe = time.monotonic() + self.breaker.record_failure()
+        raise FirestoreOffline("Firestore still unreachable")
+
+    def _retry_or_fail(self, op, attempt, attempts, error):
+        """True if another attempt should follow; otherwise counts a failed call."""
+        if attempt < attempts:
+            metrics.FIRESTORE_RETRIES.labels(op).inc()
+            logger.debug(f"Firestore {op} attempt {attempt}/{attempts} failed: {error}")
+            return True
+        with self._lock:
+            delay = self.breaker.record_failure()
+            if self.breaker.state == OFFLINE:
+                self._next_probe = time.monotonic() + delay
+        return False
+
+    def _retry_delay(self, attempt):
+        delay = min(self.max_retry_backoff, self.retry_backoff * 2 ** (attempt - 1))
+        return delay * self.rng.uniform(0.5, 1.0)
+
+    def _reached(self, op, seconds):
+        """The server answered (even with an error): record latency, close the breaker."""
+        with self._lock:
+            self._latencies.setdefault(op, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+            if self.breaker.state != HEALTHY:
+                self.breaker.record_success()
+
+    # --- Reporting ---
+
+    def stats(self):
+        """Link state plus p50/p99 latency (ms) of recent calls per operation."""
+        with self._lock:
+            windows = {op: sorted(samples) for op, samples in self._latencies.items()}
+            result = {'online': self.online, **self.breaker.stats()}
+
+        def pct(ordered, p):
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 1)
+
+        result['latency'] = {op: {'count': len(ordered), 'p50_ms': pct(ordered, 50), 'p99_ms': pct(ordered, 99)}
+                             for op, ordered in windows.items() if ordered}
+        return result
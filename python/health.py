@@ -0,0 +1,67 @@
+"""Per-device circuit breaker with exponential backoff."""
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+OFFLINE = 'offline'
+
+# Numeric encoding for the sensor_device_state gauge
+STATE_CODES = {HEALTHY: 0, DEGRADED: 1, OFFLINE: 2}
+
+
+class CircuitBreaker:
+    """Track a device's failures and decide how long to wait before the next try.
+
+    HEALTHY -> DEGRADED on the first failure (quick retries every
+    `retry_delay` s). After `threshold` consecutive failures the breaker
+    trips to OFFLINE: retries back off exponentially from `base_backoff` up
+    to `max_backoff`, with +/- `jitter` so many dead probes do not retry in
+    lockstep. `half_open()` marks a successful probe; a failure then trips
+    straight back to OFFLINE with a longer backoff, a success closes it.
+    """
+
+    def __init__(self, name, threshold=3, retry_delay=2.0, base_backoff=5.0,
+                 max_backoff=120.0, jitter=0.2, rng=None):
+        self.name = name
+        self.threshold = threshold
+        self.retry_delay = retry_delay
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.state = HEALTHY
+        self.failures = 0
+        self.trips = 0
+
+    def record_success(self):
+        if self.state != HEALTHY:
+            logger.info(f"{self.name} recovered after {self.failures} failure(s)")
+        self.state = HEALTHY
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self):
+        """Count a failure; returns the delay (s) before the next attempt."""
+        self.failures += 1
+        if self.state == OFFLINE or self.trips or self.failures >= self.threshold:
+            self.trips += 1
+            if self.state != OFFLINE:
+                logger.warning(f"{self.name} offline after {self.failures} failure(s)")
+            self.state = OFFLINE
+            return self.backoff()
+        self.state = DEGRADED
+        return self.retry_delay
+
+    def half_open(self):
+        """A probe answered: allow one full reconnect attempt."""
+        self.state = DEGRADED
+
+    def backoff(self):
+        delay = min(self.max_backoff, self.base_backoff * 2 ** max(0, self.trips - 1))
+        return delay * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+    def stats(self):
+        return {'state': self.state, 'failures': self.failures, 'trips': self.trips}
@@ -0,0 +1,160 @@
+"""Time-range reads and downsampling of the local reading history."""
+import csv
+import gzip
+import io
+import logging
+import os
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from csv_logger import load_index
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time(value):
+    """Epoch seconds from a number or an ISO-8601 string (naive = local time)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _parse_row(line):
+    """(epoch, moisture, temperature) from one CSV line, or None if malformed."""
+    parts = line.strip().split(',')
+    try:
+        return datetime.fromisoformat(parts[0]).timestamp(), float(parts[1]), float(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _first_line_at(f, offset):
+    """Offset and parsed row of the first line starting at or after `offset`."""
+    f.seek(offset - 1)
+    f.readline()  # finish the line `offset - 1` belongs to
+    start = f.tell()
+    line = f.readline()
+    return start, (_parse_row(line.decode('utf-8', 'replace')) if line else None), bool(line)
+
+
+def _seek_time(f, start, size, header_end):
+    """Byte offset of the first row with timestamp >= start (rows are time-ordered)."""
+    lo, hi = header_end, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, row, found = _first_line_at(f, mid)
+        if not found or (row is not None and row[0] >= start):
+            hi = mid
+        else:
+            lo = mid + 1
+    return _first_line_at(f, lo)[0]
+
+
+def _read_active(path, start, end):
+    """Rows of the live CSV file in [start, end), located by binary search."""
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()  # header
+        header_end = f.tell()
+        f.seek(_seek_time(f, start, size, header_end))
+        for line in f:
+            row = _parse_row(line.decode('utf-8', 'replace'))
+            if row is None:
+                continue
+            if row[0] >= end:
+                break
+            rows.append(row)
+    return rows
+
+
+def read_rotated(path, start, end):
+    """Rows of a rotated CSV file (plain or .gz) with timestamps in [start, end)."""
+    opener = gzip.open if path.endswith('.gz') else open
+    rows = []
+    with opener(path, 'rb') as f:
+        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''))
+        next(reader, None)
+        for parts in reader:
+            row = _parse_row(','.join(parts))
+            if row is not None and start <= row[0] < end:
+                rows.append(row)
+    return rows
+
+
+def read_csv_range(csv_path, start, end):
+    """(t, moisture, temperature) arrays for [start, end) from a rotated CSV log.
+
+    Rotated files are picked from the CSV index by their time range; the
+    live file is binary-searched, so neither is scanned from the top.
+    """
+    directory = os.path.dirname(csv_path)
+    index_path = f"{os.path.splitext(csv_path)[0]}.index.json"
+    rows = []
+    for entry in load_index(index_path):
+        entry_start = datetime.fromisoformat(entry['start']).timestamp()
+        entry_end = datetime.fromisoformat(entry['end']).timestamp()
+        if entry_end < start or entry_start >= end:
+            continue
+        try:
+            rows += read_rotated(os.path.join(directory, entry['file']), start, end)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable history file {entry['file']}: {e}")
+    rows += _read_active(csv_path, start, end)
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def minmax_indices(y, buckets):
+    """Indices of the min and max of `y` in each of `buckets` equal slices."""
+    n = len(y)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picks = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        window = y[lo:hi]
+        picks += sorted({lo + int(np.argmin(window)), lo + int(np.argmax(window))})
+    return np.array(picks, dtype=np.int64)
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of `threshold` visually representative points."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picks = np.empty(threshold, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_lo, next_hi = edges[i + 1], edges[i + 2]
+        else:
+            next_lo, next_hi = n - 1, n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        picks[i + 1] = a
+    return picks
+
+
+def downsample(t, moisture, temperature, points, method='lttb'):
+    """Reduce the series to about `points` samples, choosing them on the moisture channel."""
+    if method == 'minmax':
+        picks = minmax_indices(moisture, max(1, points // 2))
+    elif method == 'lttb':
+        picks = lttb_indices(t, moisture, points)
+    else:
+        raise ValueError(f"Unknown downsampling method {method!r}")
+    return t[picks], moisture[picks], temperature[picks]
@@ -0,0 +1,121 @@
+"""Columnar binary history of sensor readings, readable as NumPy arrays."""
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # Writing works without numpy; reading needs it
+    np = None
+
+from csv_logger import load_index
+from history_query import read_rotated
+
+logger = logging.getLogger(__name__)
+
+# One fixed-width little-endian record per reading: epoch seconds + channels
+RECORD = struct.Struct('<dff')
+RECORD_FIELDS = (('t', '<f8'), ('moisture', '<f4'), ('temperature', '<f4'))
+
+
+class HistoryStore:
+    """Append-only file of 16-byte records (float64 epoch, float32 moisture, float32 temperature).
+
+    Records are buffered and written every `flush_interval` seconds. Readers
+    memory-map the file and binary-search the time column, so a time range
+    comes back as NumPy views without parsing or copying. Timestamps are
+    expected to be appended in increasing order.
+    """
+
+    def __init__(self, path, flush_interval=30, fsync=False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._last_flush = time.monotonic()
+
+        # Drop a torn trailing record left by a crash mid-write
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD.size:
+                logger.warning(f"Truncating partial record at end of {path}")
+                with open(path, 'r+b') as f:
+                    f.truncate(size - size % RECORD.size)
+        self._file = open(path, 'ab')
+
+    def append(self, moisture, temperature, timestamp=None):
+        """Buffer one reading; `timestamp` is epoch seconds (default: now)."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._buffer += RECORD.pack(timestamp, moisture, temperature)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+
+    def read(self, start=None, end=None):
+        """Flush pending records, then return read_history() for this file."""
+        self.flush()
+        return read_history(self.path, start, end)
+
+
+def read_history(path, start=None, end=None):
+    """Readings with start <= t < end (epoch seconds) as (t, moisture, temperature) arrays.
+
+    The arrays are views into a read-only memory map of the file.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to read the history store")
+    empty = np.zeros(0, dtype=np.dtype(list(RECORD_FIELDS)))
+    count = os.path.getsize(path) // RECORD.size if os.path.exists(path) else 0
+    records = np.memmap(path, dtype=empty.dtype, mode='r', shape=(count,)) if count else empty
+
+    times = records['t']
+    lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+    hi = len(times) if end is None else int(np.searchsorted(times, end, side='left'))
+    window = records[lo:max(lo, hi)]
+    return window['t'], window['moisture'], window['temperature']
+
+
+def import_csv(csv_path, store):
+    """Append a CSV log to `store`: its rotated files (oldest first), then the live file."""
+    directory = os.path.dirname(csv_path)
+    index_path = f"{os.path.splitext(csv_path)[0]}.index.json"
+    paths = [os.path.join(directory, entry['file']) for entry in load_index(index_path)]
+    paths.append(csv_path)
+
+    count = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            rows = read_rotated(path, float('-inf'), float('inf'))
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping unreadable history file {path}: {e}")
+            continue
+        for timestamp, moisture, temperature in rows:
+            store.append(moisture, temperature, timestamp)
+        count += len(rows)
+    store.flush()
+    logger.info(f"Imported {count} reading(s) from {csv_path} and its rotated files into {store.path}")
+    return count
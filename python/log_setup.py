@@ -0,0 +1,128 @@
+"""Non-blocking logging: queue hand-off, rotation, JSON lines and rate limiting."""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Numbers vary between otherwise identical messages ("Read: 31.5% ..."). Digits
+# glued to a word ("[SIM-0001]", "ttyUSB0", "FAMINGA_123") are part of a device
+# ID and stay in the key, so one device cannot suppress another's messages.
+_NUMBERS = re.compile(r'(?<![\w.-])-?\d+(?:\.\d+)?')
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `burst` similar messages through per `interval` seconds.
+
+    Messages are similar when they come from the same logger at the same
+    level and differ only in free-standing numbers (device IDs are kept
+    apart). The first message after a suppressed stretch reports how many
+    were dropped. CRITICAL is never limited.
+    """
+
+    def __init__(self, interval=60, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.name, record.levelno, _NUMBERS.sub('#', str(record.msg)))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 1000:
+                    self._prune(now)
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} (suppressed {suppressed} similar message(s))"
+            record.args = None
+        return True
+
+    def _prune(self, now):
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+            del self._windows[key]
+
+
+def setup_logging(log_file='sensor.log', level=logging.INFO, json_lines=False,
+                  max_bytes=5 * 1024 * 1024, backup_count=5, rate_interval=60, rate_burst=5):
+    """Route all logging through a queue to a rotating file and stderr.
+
+    Callers only enqueue the record; formatting and file I/O happen on the
+    listener thread. Calling it again replaces the previous configuration.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = JsonFormatter() if json_lines else logging.Formatter(TEXT_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    stream_handler = logging.StreamHandler(sys.stderr)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if rate_burst:
+        queue_handler.addFilter(RateLimitFilter(rate_interval, rate_burst))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Drain the queue and close the handlers (registered with atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,227 @@
+"""Minimal in-process metrics exported in the Prometheus text format."""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """The child for one combination of label values (created on first use)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in sorted(self._children.items()):
+            lines += child.render(self.name, self.labelnames, key)
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_label_text(labelnames, key)} {_number(self.value)}"]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Sample `function()` at scrape time instead of a stored value."""
+        self.function = function
+
+    def render(self, name, labelnames, key):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float('nan')
+        return [f"{name}{_label_text(labelnames, key)} {_number(value)}"]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of the `with` block, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _label_text(labelnames, key, [('le', _number(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        lines.append(f"{name}_sum{_label_text(labelnames, key)} {_number(total)}")
+        lines.append(f"{name}_count{_label_text(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observe() is one bisect plus two additions."""
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=(), registry=None):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- Pipeline metrics ---
+MODBUS_READ_SECONDS = Histogram(
+    'sensor_modbus_read_seconds', 'Duration of one Modbus read of both registers.', ['device'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+MODBUS_ERRORS = Counter(
+    'sensor_modbus_errors_total', 'Failed Modbus reads by kind (no_response, invalid_response, serial).',
+    ['device', 'kind'])
+RECONNECTS = Counter(
+    'sensor_reconnects_total', 'Times the Modbus instrument was (re)initialized.', ['device'])
+READINGS = Counter(
+    'sensor_readings_total', 'Successful Modbus reads.', ['device'])
+DEVICE_STATE = Gauge(
+    'sensor_device_state', 'Connection health per device (0 healthy, 1 degraded, 2 offline).', ['device'])
+SESSION_CHECK_SECONDS = Histogram(
+    'sensor_session_check_seconds', 'Duration of the per-cycle session validity check.', ['device'],
+    buckets=(0.0001, 0.001, 0.01, 0.1, 0.5, 1, 5))
+FIRESTORE_SECONDS = Histogram(
+    'sensor_firestore_seconds', 'Duration of Firestore round trips by operation.', ['op'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+FIRESTORE_ERRORS = Counter(
+    'sensor_firestore_errors_total', 'Failed Firestore operations by operation.', ['op'])
+FIRESTORE_RETRIES = Counter(
+    'sensor_firestore_retries_total', 'Firestore attempts repeated after a transient error.', ['op'])
+FIRESTORE_SKIPPED = Counter(
+    'sensor_firestore_skipped_total', 'Firestore calls refused at once while the link was offline.', ['op'])
+FIRESTORE_ONLINE = Gauge(
+    'sensor_firestore_online', '1 while Firestore is reachable, 0 in offline fast-fail mode.')
+UPLOAD_BACKLOG = Gauge(
+    'sensor_upload_backlog', 'Readings waiting for upload (memory plus offline queue).')
+STREAM_CLIENTS = Gauge(
+    'sensor_stream_clients', 'Open /stream connections.')
+
+
+@contextmanager
+def firestore_call(op):
+    """Time a Firestore operation and count it as an error if it raises."""
+    try:
+        with FIRESTORE_SECONDS.labels(op).time():
+            yield
+    except Exception:
+        FIRESTORE_ERRORS.labels(op).inc()
+        raise
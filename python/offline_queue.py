@@ -0,0 +1,108 @@
+"""Crash-safe on-disk queue for readings that have not reached Firestore."""
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineQueue:
+    """Append-only SQLite (WAL) queue of pending readings.
+
+    Rows are appended when an upload fails and removed once a batch
+    containing them has been committed. Disk use is bounded by `max_rows`;
+    when the limit is reached the oldest readings are evicted first. Eviction
+    is logged once when it starts and summarized once the backlog drains.
+    """
+
+    def __init__(self, path, max_rows=200000):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " sampled_at REAL NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+        # Readings evicted since the queue last filled up; logged once per stretch
+        self._evicted = 0
+        if self._count:
+            logger.info(f"Offline queue restored with {self._count} pending reading(s)")
+
+    def pending(self):
+        """Number of readings still waiting to be uploaded."""
+        return self._count
+
+    def push_many(self, items):
+        """Append readings (uploader item dicts) to the queue."""
+        if not items:
+            return
+        rows = []
+        for item in items:
+            payload = dict(item)
+            sampled_at = payload.pop('sampledAt')
+            rows.append((sampled_at.timestamp(), json.dumps(payload)))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO pending (sampled_at, payload) VALUES (?, ?)", rows)
+            self._count += len(rows)
+            overflow = self._count - self.max_rows
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM pending WHERE id IN (SELECT id FROM pending ORDER BY id LIMIT ?)",
+                    (overflow,)
+                )
+                self._count -= overflow
+            self._conn.execute("COMMIT")
+
+            first_eviction = overflow > 0 and self._evicted == 0
+            if overflow > 0:
+                self._evicted += overflow
+
+        if first_eviction:
+            logger.warning(f"Offline queue full ({self.max_rows} readings), evicting the oldest "
+                           "until the backlog drains")
+
+    def peek(self, limit):
+        """Return up to `limit` oldest readings as (row_id, item) pairs."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, sampled_at, payload FROM pending ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+        batch = []
+        for row_id, sampled_at, payload in rows:
+            item = json.loads(payload)
+            item['sampledAt'] = datetime.fromtimestamp(sampled_at, tz=timezone.utc)
+            batch.append((row_id, item))
+        return batch
+
+    def ack(self, row_ids):
+        """Remove readings that were committed successfully."""
+        if not row_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cur = self._conn.execute(
+                f"DELETE FROM pending WHERE id IN ({','.join('?' * len(row_ids))})", row_ids
+            )
+            self._count -= cur.rowcount
+            self._conn.execute("COMMIT")
+            evicted = self._evicted if self._count < self.max_rows else 0
+            if evicted:
+                self._evicted = 0
+
+        if evicted:
+            logger.warning(f"Offline queue draining, {evicted} oldest reading(s) were evicted while it was full")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,99 @@
+"""Drift-free periodic scheduling on the monotonic clock."""
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicSchedule:
+    """Fire on fixed absolute deadlines: anchor + n * period.
+
+    Work time and sleeps do not accumulate into the period. When a cycle
+    overruns, the missed ticks are skipped (and counted) instead of being
+    fired in a burst, so samples stay on the grid. Lateness of each tick
+    (jitter) and overruns are tracked for reporting.
+    """
+
+    def __init__(self, period, clock=time.monotonic, name=None):
+        self.period = float(period)
+        self.clock = clock
+        self.name = name
+        self.reset()
+
+    def reset(self, now=None):
+        """Re-anchor the grid so the next tick is due now."""
+        now = self.clock() if now is None else now
+        self._anchor = now
+        self._deadline = now
+        self.ticks = 0
+        self.missed = 0
+        self.overruns = 0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+        self._jitter_max = 0.0
+
+    @property
+    def deadline(self):
+        return self._deadline
+
+    def remaining(self, now=None):
+        now = self.clock() if now is None else now
+        return self._deadline - now
+
+    def due(self, now=None):
+        return self.remaining(now) <= 0
+
+    def wait(self, stop_event=None):
+        """Sleep until the next deadline (returns early if stop_event is set)."""
+        delay = self.remaining()
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+
+    def start_tick(self, now=None):
+        """Record that the tick due at `deadline` started now."""
+        now = self.clock() if now is None else now
+        jitter = max(0.0, now - self._deadline)
+        self.ticks += 1
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / self.ticks
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+        self._jitter_max = max(self._jitter_max, jitter)
+
+    def finish_tick(self, delay=None, now=None):
+        """Schedule the next tick after the current one completed.
+
+        `delay` other than the period (e.g. an error back-off) pushes the
+        next tick to the first grid point at least `delay` seconds away.
+        """
+        now = self.clock() if now is None else now
+        if delay is None or delay == self.period:
+            target = self._deadline + self.period
+            if target <= now:
+                skipped = math.floor((now - target) / self.period) + 1
+                target += skipped * self.period
+                self.missed += skipped
+                self.overruns += 1
+                logger.warning(f"{self.name or 'Schedule'} overran its {self.period:g}s period, "
+                               f"skipped {skipped} tick(s)")
+        else:
+            target = now + delay
+
+        # Snap onto the grid so the series stays evenly spaced
+        n = math.ceil((target - self._anchor) / self.period - 1e-9)
+        self._deadline = self._anchor + n * self.period
+
+    def stats(self):
+        jitter_std = math.sqrt(self._jitter_m2 / self.ticks) if self.ticks else 0.0
+        return {
+            'period': self.period,
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'overruns': self.overruns,
+            'jitter_ms_mean': round(self._jitter_mean * 1000, 2),
+            'jitter_ms_max': round(self._jitter_max * 1000, 2),
+            'jitter_ms_std': round(jitter_std * 1000, 2),
+        }
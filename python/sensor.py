@@ -1,39 +1,112 @@
-from flask import Flask, jsonify, render_template_string, request
+import time
+# Startup phases are reported relative to the moment this module began loading
+STARTUP_T0 = time.perf_counter()
+
+from flask import Flask, Response, jsonify, request
 import argparse
-import minimalmodbus
+import asyncio
+import atexit
+import gzip
+import hashlib
 import serial
 import serial.tools.list_ports
+import subprocess
+import sys
 import threading
-import time
 import logging
-from datetime import datetime
-import csv
+import json
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+# firebase_admin, the Firestore client (gRPC) and numpy cost well over a
+# second to import on a Pi; they are loaded on first use or in the
+# background by init_firebase(), never on the startup path.
+from offline_queue import OfflineQueue
+from session_cache import SessionCache, session_age_minutes
+from devices import DeviceConfig, SensorDevice, build_bus_schedulers, load_device_configs, new_state
+import discovery
+import metrics
+from log_setup import setup_logging
+from aggregation import MAX_UPLOAD_INTERVAL
+from deadband import MAX_KEEPALIVE
+from csv_logger import CsvLogger
+from stream import Broadcaster, TooManyClients, encode_event
 
 app = Flask(__name__)
+# Bundled assets (static/chart.umd.min.js) rarely change; let browsers cache them
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 24 * 3600
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('sensor.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued, rotating; reconfigured from CLI flags in __main__)
+LOG_FILE = 'sensor.log'
+setup_logging(LOG_FILE)
 logger = logging.getLogger(__name__)
 
-# --- Firebase Setup ---
-try:
-    cred = credentials.Certificate("firebase_key.json")
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logger.info("Firebase Admin SDK initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Firebase: {e}")
-    db = None
+# --- Firebase Setup (init_firebase(), run in parallel with discovery) ---
+FIREBASE_KEY_FILE = "firebase_key.json"
+db = None
+
+# Every Firestore round trip goes through this: deadlines, bounded retries, offline fast-fail
+gateway = None
+
+def init_firebase(key_file=FIREBASE_KEY_FILE):
+    """Import the Firebase SDK and create the Firestore client; returns it or None."""
+    global db, gateway
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from firestore_gateway import FirestoreGateway
+
+    try:
+        cred = credentials.Certificate(key_file)
+        firebase_admin.initialize_app(cred)
+        db = firestore.client()
+        gateway = FirestoreGateway(db)
+        logger.info("Firebase Admin SDK initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize Firebase: {e}")
+        db = None
+    mark_startup('firebase')
+    return db
+
+# Seconds since STARTUP_T0 at which each startup phase completed
+startup_phases = {}
+
+def mark_startup(phase):
+    startup_phases[phase] = round(time.perf_counter() - STARTUP_T0, 3)
+
+def import_time_report(limit=15):
+    """Import cost of this module and of the deferred Firebase stack, from a fresh interpreter."""
+    deferred = ('firebase_admin.firestore', 'firestore_gateway', 'uploader', 'history_query')
+    code = 'import sensor; ' + '; '.join(f'import {name}' for name in deferred)
+    import tempfile
+    # Import from a scratch directory: module-level logging setup creates sensor.log in the cwd
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH')])))
+    with tempfile.TemporaryDirectory() as scratch:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                                cwd=scratch, env=env)
+    # Rows come children-first; a depth-0 row closes the group of one top-level import
+    startup, background, group = [], [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        row = (int(cumulative) / 1e6, name.strip())
+        if depth > 0:
+            group.append((depth, row))
+            continue
+        if row[1] == 'sensor':
+            startup = [row] + [child for child_depth, child in group if child_depth == 1]
+        elif row[1] in deferred:
+            background.append(row)
+        group = []
+
+    lines = ["Startup path (import sensor):"]
+    lines += [f"  {seconds:7.3f}s  {name}" for seconds, name in sorted(startup, reverse=True)[:limit]]
+    lines.append("Deferred (first use / init_firebase, beyond what sensor already loaded):")
+    lines += [f"  {seconds:7.3f}s  {name}" for seconds, name in sorted(background, reverse=True)]
+    return '\n'.join(lines)
 
 # --- Sensor Configuration (Session-Based) ---
 # These will be set from command-line arguments or session
@@ -44,120 +117,126 @@ sensor_field_id = None
 # Session timeout in minutes
 SESSION_TIMEOUT_MINUTES = 10
 
-# Offline buffering
-offline_buffer = []
-MAX_OFFLINE_BUFFER = 50
+# Idle sensors refresh their unassigned_sensors entry this often (seconds);
+# assignment itself is pushed by the session listener
+PRESENCE_TTL = 240
+
+# Local re-check of idle devices in multi-sensor mode (no Firestore traffic)
+ASSIGNMENT_CHECK_INTERVAL = 3
+
+# Offline buffering (readings that failed to upload are kept on disk)
+OFFLINE_QUEUE_FILE = "offline_queue.db"
+MAX_OFFLINE_READINGS = 200000  # ~11 days at one reading every 5 seconds
+
+# Last-known (port, slave, baudrate) inventory, re-verified at startup
+PORT_CACHE_FILE = "sensor_ports.json"
+
+# Last live session (single-sensor mode), so a restart resumes sampling at once
+SESSION_STATE_FILE = "sensor_session.json"
+
+# Background Firestore upload stage (started in __main__)
+uploader = None
+
+# Listener-backed cache of sensor_sessions/{HARDWARE_ID} (started in __main__)
+session_cache = None
 
 # --- Auto-Discovery Functions ---
 
 def get_unique_hardware_id():
     """Generate a stable Hardware ID based on the USB device."""
     try:
-        import serial.tools.list_ports
         ports = list(serial.tools.list_ports.comports())
         for port in ports:
             # Look for CH340 or generic USB-Serial or specific USB VID/PID
-            if "USB-SERIAL" in port.description.upper() or "CH340" in port.description.upper() or "USB SERIAL" in port.description.upper():
-                if port.serial_number:
-                    return f"FAMINGA_{port.serial_number}"
-                # Fallback if no serial number (common with cheap clones)
-                return f"FAMINGA_{port.device.replace('/', '_').replace('COM', '')}"
+            if discovery.is_usb_serial(port):
+                return discovery.port_hardware_id(port)
     except Exception as e:
         logger.error(f"Error checking ports: {e}")
     
     # Fallback for when no obvious USB-Serial found (maybe generic)
     return "FAMINGA_UNKNOWN_DEVICE"
 
-def scan_for_sensor_port():
-    """Scan all ports to find the Modbus sensor"""
-    import serial.tools.list_ports
-    ports = list(serial.tools.list_ports.comports())
-    
-    for port in ports:
-        try:
-            # Skip bluetooth ports often named like this
-            if "Bluetooth" in port.description: continue
-            
-            logger.debug(f"Scanning port {port.device}...")
-            # Try to connect and read something
-            temp_instr = minimalmodbus.Instrument(port.device, 1)
-            temp_instr.serial.baudrate = 9600
-            temp_instr.serial.timeout = 0.5
-            temp_instr.close_port_after_each_call = True
-            
-            # Read one register to verify it's our sensor
-            temp_instr.read_register(0, 0, 3)
-            logger.info(f"OK Found sensor on {port.device}")
-            return port.device
-        except:
-            continue
-    return None
+def find_sensor(slaves=discovery.DEFAULT_SLAVES, baudrates=discovery.DEFAULT_BAUDRATES, use_cache=True):
+    """Locate a sensor, re-verifying the last-known mapping before a full parallel scan.
+
+    Returns an inventory entry (port, slave, baudrate, ...) or None.
+    """
+    if use_cache:
+        known = discovery.verify(discovery.load_inventory(PORT_CACHE_FILE))
+        if known:
+            logger.info(f"OK Reusing cached sensor location {known[0]['port']} (slave {known[0]['slave']})")
+            return known[0]
 
-def announce_presence(hardware_id):
-    """Tell Firestore we are here and waiting for assignment"""
-    if db is None: return
+    inventory = discovery.discover(slaves, baudrates)
+    if not inventory:
+        return None
+    discovery.save_inventory(PORT_CACHE_FILE, inventory)
+    return inventory[0]
+
+def _presence_doc(hardware_id):
+    from firebase_admin import firestore
+    return {
+        'hardwareId': hardware_id,
+        'status': 'waiting',
+        'lastSeen': firestore.SERVER_TIMESTAMP,
+        'deviceInfo': {
+             'platform': 'windows',
+             'version': '1.0'
+        }
+    }
+
+def announce_presence(hardware_id, refresh=False):
+    """Tell Firestore we are here and waiting for assignment.
+
+    `refresh` only bumps `lastSeen` on the existing document (rewritten in
+    full if the app removed it). Returns True on success.
+    """
+    if db is None: return False
     
+    from firebase_admin import firestore
+    from google.api_core import exceptions as gexc
+
     try:
         doc_ref = db.collection('unassigned_sensors').document(hardware_id)
-        doc_ref.set({
-            'hardwareId': hardware_id,
-            'status': 'waiting',
-            'lastSeen': firestore.SERVER_TIMESTAMP,
-            'deviceInfo': {
-                 'platform': 'windows',
-                 'version': '1.0'
-            }
-        })
+        if refresh:
+            try:
+                gateway.call('presence', doc_ref.update, {'lastSeen': firestore.SERVER_TIMESTAMP})
+                return True
+            except gexc.NotFound:
+                pass
+        gateway.call('presence', doc_ref.set, _presence_doc(hardware_id))
         logger.info(f"> Announced presence as {hardware_id} - Waiting for app...")
+        return True
     except Exception as e:
         logger.error(f"Failed to announce: {e}")
+        return False
+
+async def announce_presence_async(adb, hardware_id, refresh=False):
+    """announce_presence() for the asyncio runtime, using the async client"""
+    from firebase_admin import firestore
+    from google.api_core import exceptions as gexc
 
-# --- Modbus RS485 Sensor Setup ---
-instrument = None
-instrument_lock = threading.Lock()
-
-def list_available_ports():
-    """List all available COM ports"""
-    ports = serial.tools.list_ports.comports()
-    logger.info("Available COM ports:")
-    for port in ports:
-        logger.info(f"  {port.device}: {port.description}")
-    return ports
-
-def initialize_sensor(port='COM6'):
-    """Initialize Modbus sensor with proper port handling"""
-    global instrument
-    
     try:
-        with instrument_lock:
-            # Close existing connection if any
-            if instrument is not None:
-                try:
-                    if hasattr(instrument, 'serial') and instrument.serial:
-                        if instrument.serial.is_open:
-                            instrument.serial.close()
-                        time.sleep(0.5)  # Give the port time to close
-                except Exception as e:
-                    logger.warning(f"Error closing previous connection: {e}")
-            
-            # Create new instrument with proper settings
-            instrument = minimalmodbus.Instrument(port, 1)
-            instrument.serial.baudrate = 9600
-            instrument.serial.bytesize = 8
-            instrument.serial.parity = serial.PARITY_NONE
-            instrument.serial.stopbits = 1
-            instrument.serial.timeout = 1
-            instrument.close_port_after_each_call = True  # CRITICAL: Close port between calls
-            instrument.clear_buffers_before_each_transaction = True
-            
-            logger.info(f"Modbus sensor initialized on {port}")
-            return True
-            
+        doc_ref = adb.collection('unassigned_sensors').document(hardware_id)
+        if refresh:
+            try:
+                await gateway.call_async('presence', doc_ref.update, {'lastSeen': firestore.SERVER_TIMESTAMP})
+                return True
+            except gexc.NotFound:
+                pass
+        await gateway.call_async('presence', doc_ref.set, _presence_doc(hardware_id))
+        logger.info(f"> Announced presence as {hardware_id} - Waiting for app...")
+        return True
     except Exception as e:
-        logger.error(f"Failed to initialize sensor: {e}")
-        instrument = None
+        logger.error(f"Failed to announce: {e}")
         return False
 
+def keep_presence(hardware_id, cache):
+    """Announce an idle sensor: the full document once, then a lastSeen bump every PRESENCE_TTL."""
+    if cache.presence_due(PRESENCE_TTL):
+        if announce_presence(hardware_id, refresh=cache.presence_announced):
+            cache.mark_presence()
+
 def get_active_session(hardware_id):
     """Get the active session for a sensor from Firestore"""
     if db is None:
@@ -166,7 +245,7 @@ def get_active_session(hardware_id):
     
     try:
         session_ref = db.collection('sensor_sessions').document(hardware_id)
-        session_doc = session_ref.get()
+        session_doc = gateway.call('session_get', session_ref.get)
         
         if not session_doc.exists:
             logger.warning(f"No session found for sensor {hardware_id}")
@@ -180,16 +259,10 @@ def get_active_session(hardware_id):
             return None
         
         # Check if session is expired (no heartbeat in last 10 minutes)
-        last_heartbeat = session_data.get('lastHeartbeat')
-        if last_heartbeat:
-            from datetime import datetime, timezone
-            now = datetime.now(timezone.utc)
-            heartbeat_time = last_heartbeat.replace(tzinfo=timezone.utc)
-            age_minutes = (now - heartbeat_time).total_seconds() / 60
-            
-            if age_minutes > SESSION_TIMEOUT_MINUTES:
-                logger.warning(f"Session for {hardware_id} expired ({age_minutes:.1f} minutes old)")
-                return None
+        age_minutes = session_age_minutes(session_data)
+        if age_minutes is not None and age_minutes > SESSION_TIMEOUT_MINUTES:
+            logger.warning(f"Session for {hardware_id} expired ({age_minutes:.1f} minutes old)")
+            return None
         
         logger.info(f"Active session found for {hardware_id}: user={session_data.get('userId')}, field={session_data.get('fieldId')}")
         return session_data
@@ -198,60 +271,29 @@ def get_active_session(hardware_id):
         logger.error(f"Failed to get session: {e}")
         return None
 
-def validate_session(hardware_id, expected_user_id):
-    """Validate that the session is still active and belongs to expected user"""
-    session = get_active_session(hardware_id)
-    
-    if session is None:
-        return False
-    
-    if session.get('userId') != expected_user_id:
-        logger.error(f"Session user mismatch: expected {expected_user_id}, got {session.get('userId')}")
-        return False
-    
-    return True
-
-def update_heartbeat(hardware_id):
-    """Update the session heartbeat timestamp"""
-    if db is None:
-        return False
-    
-    try:
-        session_ref = db.collection('sensor_sessions').document(hardware_id)
-        session_ref.update({
-            'lastHeartbeat': firestore.SERVER_TIMESTAMP
-        })
-        return True
-    except Exception as e:
-        logger.error(f"Failed to update heartbeat: {e}")
-        return False
-
 def create_session(hardware_id, user_id, field_id):
     """Create a new session for the sensor"""
     if db is None:
         return False
         
+    from firebase_admin import firestore
+
     try:
         session_ref = db.collection('sensor_sessions').document(hardware_id)
         
         # Check if already active for another user
-        doc = session_ref.get()
+        doc = gateway.call('session_get', session_ref.get)
         if doc.exists:
             data = doc.to_dict()
             if data.get('active') and data.get('userId') != user_id:
                 # Check timeout
-                last_heartbeat = data.get('lastHeartbeat')
-                if last_heartbeat:
-                    from datetime import datetime, timezone
-                    now = datetime.now(timezone.utc)
-                    heartbeat_time = last_heartbeat.replace(tzinfo=timezone.utc)
-                    age_minutes = (now - heartbeat_time).total_seconds() / 60
-                    if age_minutes < SESSION_TIMEOUT_MINUTES:
-                        logger.error(f"Sensor claimed by another user: {data.get('userId')}")
-                        return False
+                age_minutes = session_age_minutes(data)
+                if age_minutes is not None and age_minutes < SESSION_TIMEOUT_MINUTES:
+                    logger.error(f"Sensor claimed by another user: {data.get('userId')}")
+                    return False
         
         # Create/Overwrite session
-        session_ref.set({
+        gateway.call('session_create', session_ref.set, {
             'userId': user_id,
             'fieldId': field_id,
             'active': True,
@@ -264,258 +306,223 @@ def create_session(hardware_id, user_id, field_id):
         logger.error(f"Failed to create session: {e}")
         return False
 
-def get_sensor_registration(hardware_id):
-    """Query Firestore to get sensor registration (userId and fieldId)"""
-    global sensor_user_id, sensor_field_id
-    
-    if db is None:
-        logger.error("Firebase not initialized, cannot lookup sensor registration")
-        return False
-    
-    try:
-        logger.info(f"Looking up registration for sensor: {hardware_id}")
-        sensors_ref = db.collection('sensors')
-        query = sensors_ref.where('hardwareId', '==', hardware_id).limit(1).get()
-        
-        if not query:
-            logger.error(f"Sensor {hardware_id} is not registered in Firestore!")
-            logger.error("Please register this sensor in the app first.")
-            return False
-        
-        sensor_doc = query[0]
-        sensor_data = sensor_doc.to_dict()
-        
-        sensor_user_id = sensor_data.get('userId')
-        sensor_field_id = sensor_data.get('farmId') or sensor_data.get('fieldId')  # Support both field names
-        
-        if not sensor_user_id:
-            logger.error("Sensor registration missing userId!")
-            return False
-        
-        logger.info(f"✅ Sensor registered to user: {sensor_user_id}")
-        if sensor_field_id:
-            logger.info(f"✅ Sensor assigned to field: {sensor_field_id}")
-        else:
-            logger.warning("⚠️ Sensor not assigned to a field yet")
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to lookup sensor registration: {e}")
-        return False
-
-# --- Global state with thread safety ---
-data_lock = threading.Lock()
+# --- Global state (published as immutable snapshots, read without locks) ---
 sensor_active = True
-latest_data = {
-    "moisture": 0,
-    "temperature": 0,
-    "timestamp": None,
-    "status": "initializing",
-    "moisture_status": "",
-    "temp_status": ""
-}
+latest_data = new_state()
+
+# Devices driven by this process, keyed by hardware ID
+devices = {}
+
+# Pushes every state change to /stream clients
+STREAM_MAX_CLIENTS = 10
+broadcaster = Broadcaster(max_clients=STREAM_MAX_CLIENTS)
+
+metrics.UPLOAD_BACKLOG.set_function(lambda: uploader.pending() if uploader else 0)
+metrics.STREAM_CLIENTS.set_function(lambda: broadcaster.client_count)
+metrics.FIRESTORE_ONLINE.set_function(lambda: int(gateway is not None and gateway.online))
 
 # CSV logging configuration
 CSV_FILE = "sensor_data.csv"
 ENABLE_CSV_LOGGING = True
+CSV_FLUSH_INTERVAL = 30          # seconds between buffered writes
+CSV_FSYNC = False                # fsync after each flush (slower, survives power loss)
+CSV_MAX_BYTES = 5 * 1024 * 1024  # rotate when the active file reaches this size
+CSV_ROTATE_DAILY = True
+CSV_COMPRESS = True              # gzip rotated files
 
-def initialize_csv():
-    """Initialize CSV file with headers if it doesn't exist"""
-    if not os.path.exists(CSV_FILE):
-        try:
-            with open(CSV_FILE, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'moisture', 'temperature'])
-            logger.info(f"Created CSV file: {CSV_FILE}")
-        except Exception as e:
-            logger.error(f"Failed to create CSV file: {e}")
-
-def log_to_csv(moisture, temperature):
-    """Log sensor data to CSV file"""
+# One buffered logger per CSV file, keyed by path
+csv_loggers = {}
+csv_loggers_lock = threading.Lock()
+
+def get_csv_logger(csv_file=CSV_FILE):
+    """Return the buffered logger for `csv_file`, creating it (and its header) on first use."""
+    with csv_loggers_lock:
+        csv_logger = csv_loggers.get(csv_file)
+        if csv_logger is None:
+            csv_logger = CsvLogger(
+                csv_file,
+                flush_interval=CSV_FLUSH_INTERVAL,
+                fsync=CSV_FSYNC,
+                max_bytes=CSV_MAX_BYTES,
+                rotate_daily=CSV_ROTATE_DAILY,
+                compress=CSV_COMPRESS
+            )
+            csv_loggers[csv_file] = csv_logger
+        return csv_logger
+
+def log_to_csv(moisture, temperature, csv_file=CSV_FILE):
+    """Log sensor data to CSV file (buffered)"""
     if not ENABLE_CSV_LOGGING:
         return
     try:
-        with open(CSV_FILE, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now().isoformat(),
-                moisture,
-                temperature
-            ])
+        get_csv_logger(csv_file).write(moisture, temperature)
     except Exception as e:
         logger.error(f"Failed to write to CSV: {e}")
 
-def evaluate_conditions(moisture, temperature):
-    """Return status messages based on moisture and temperature levels."""
-    if moisture < 30:
-        moisture_status = "🌵 Too Dry — Irrigation Needed!"
-    elif 30 <= moisture <= 60:
-        moisture_status = "✅ Moisture Good"
-    else:
-        moisture_status = "💧 Too Wet — Check Drainage"
+def close_csv_loggers():
+    """Flush and close every CSV logger (registered with atexit)."""
+    with csv_loggers_lock:
+        for csv_file, csv_logger in csv_loggers.items():
+            try:
+                csv_logger.close()
+            except Exception as e:
+                logger.error(f"Failed to close CSV file {csv_file}: {e}")
+        csv_loggers.clear()
 
-    if temperature < 10:
-        temp_status = "❄️ Too Cold — Poor Growth"
-    elif 10 <= temperature <= 35:
-        temp_status = "🌿 Temperature Good"
-    else:
-        temp_status = "🔥 Too Hot — Stress Risk"
+atexit.register(close_csv_loggers)
+
+# Optional binary history (sensor_data.csv -> sensor_data.bin), enabled with --history-store
+ENABLE_HISTORY_STORE = False
+history_stores = {}
+
+def get_history_store(csv_file=CSV_FILE):
+    """Return the binary history store that sits next to `csv_file`."""
+    path = os.path.splitext(csv_file)[0] + '.bin'
+    with csv_loggers_lock:
+        store = history_stores.get(path)
+    if store is not None:
+        return store
+
+    from history_store import HistoryStore, import_csv
+    # First run with --history-store: seed the new file from the existing CSV log once.
+    # Done before the store is published (so /history keeps reading the CSV meanwhile)
+    # and outside csv_loggers_lock (so CSV writers are not stalled).
+    migrate = not os.path.exists(path) or os.path.getsize(path) == 0
+    store = HistoryStore(path, flush_interval=CSV_FLUSH_INTERVAL, fsync=CSV_FSYNC)
+    if migrate:
+        import_csv(csv_file, store)
+    with csv_loggers_lock:
+        return history_stores.setdefault(path, store)
+
+def close_history_stores():
+    """Flush and close every history store (registered with atexit)."""
+    with csv_loggers_lock:
+        for store in history_stores.values():
+            try:
+                store.close()
+            except Exception as e:
+                logger.error(f"Failed to close history store {store.path}: {e}")
+        history_stores.clear()
+
+atexit.register(close_history_stores)
+
+def stop_uploader():
+    """Persist the readings still queued in memory (registered with atexit)."""
+    if uploader is not None:
+        uploader.stop()
+
+atexit.register(stop_uploader)
+
+def exit_on_sigterm(signum, frame):
+    """Turn a service stop into SystemExit so the atexit hooks flush and close files."""
+    raise SystemExit(0)
+
+def device_csv_file(config):
+    return config.csv_file or f"sensor_data_{config.hardware_id}.csv"
+
+def add_device(config, session_cache=None, state=None):
+    """Create a SensorDevice for this process and register it in `devices`."""
+    csv_file = device_csv_file(config)
+    if ENABLE_CSV_LOGGING:
+        try:
+            get_csv_logger(csv_file)
+        except OSError as e:
+            logger.error(f"Failed to open CSV file {csv_file}: {e}")
+
+    history = None
+    if ENABLE_HISTORY_STORE:
+        try:
+            history = get_history_store(csv_file)
+        except OSError as e:
+            logger.error(f"Failed to open history store for {csv_file}: {e}")
+
+    if session_cache is None:
+        session_cache = SessionCache(db, config.hardware_id, SESSION_TIMEOUT_MINUTES, gateway=gateway)
+        session_cache.start()
 
-    return moisture_status, temp_status
+    device = SensorDevice(
+        config,
+        uploader=uploader,
+        session_cache=session_cache,
+        csv_log=partial(log_to_csv, csv_file=csv_file),
+        state=state,
+        history=history,
+        on_update=broadcaster.publish
+    )
+    devices[config.hardware_id] = device
+    return device
 
-def read_soil_sensor(port_name, user_id, field_id):
-    """Background thread that continuously reads Modbus RS485 soil sensor data."""
-    global sensor_active, instrument
+def read_soil_sensor(port_name, user_id, field_id, config=None):
+    """Continuously read the Modbus RS485 soil sensor until its session ends."""
     logger.info(f"Sensor thread started on {port_name} for User: {user_id}")
-    
-    consecutive_errors = 0
-    max_consecutive_errors = 3
-    last_success_time = time.time()
 
+    device = devices.get(HARDWARE_ID)
+    if device is None or device.config.port != port_name:
+        config = config or DeviceConfig(HARDWARE_ID, port_name, csv_file=CSV_FILE)
+        device = add_device(config, session_cache=session_cache, state=latest_data)
+
+    device.active = sensor_active
+    device.assign(user_id, field_id)
+
+    # Fixed-deadline sampling: returns once the session is lost
     while True:
-        try:
-            if sensor_active:
-                # SESSION VALIDATION: Check if session is still valid
-                if not validate_session(HARDWARE_ID, user_id):
-                    logger.error("ERR Session lost or invalid - stopping sensor loop")
-                    with data_lock:
-                        latest_data["status"] = "session_lost"
-                    break  # Exit the loop
-                
-                if instrument is None:
-                    logger.info(f"Initializing sensor connection on {port_name}...")
-                    if initialize_sensor(port_name):
-                        consecutive_errors = 0
-                        time.sleep(1)  # Give sensor time to stabilize
-                    else:
-                        with data_lock:
-                            latest_data["status"] = "error"
-                        time.sleep(5)
-                        continue
-
-                try:
-                    with instrument_lock:
-                        # Read Modbus registers (holding registers 0 & 1)
-                        moisture_raw = instrument.read_register(0, 0, 3)
-                        time.sleep(0.1)  # Small delay between reads
-                        temp_raw = instrument.read_register(1, 0, 3)
-                    
-                    # Reset error counter on successful read
-                    consecutive_errors = 0
-                    last_success_time = time.time()
-                    
-                    # Convert to engineering units
-                    moisture = moisture_raw / 10.0
-                    temperature = temp_raw / 10.0
-
-                    # Evaluate conditions
-                    moisture_status, temp_status = evaluate_conditions(moisture, temperature)
-
-                    # Thread-safe data update
-                    with data_lock:
-                        latest_data["moisture"] = round(moisture, 1)
-                        latest_data["temperature"] = round(temperature, 1)
-                        latest_data["timestamp"] = time.time()
-                        latest_data["status"] = "active"
-                        latest_data["moisture_status"] = moisture_status
-                        latest_data["moisture_status"] = moisture_status
-                        latest_data["temp_status"] = temp_status
-
-                    # Upload to Firestore
-                    if db and user_id:
-                        try:
-                            # Write to sensor-specific document using hardwareId (latest snapshot)
-                            doc_ref = db.collection('faminga_sensors').document(HARDWARE_ID)
-                            doc_ref.set({
-                                'userId': user_id,
-                                'fieldId': field_id,
-                                'hardwareId': HARDWARE_ID,
-                                'moisture': round(moisture, 1),
-                                'temperature': round(temperature, 1),
-                                'moisture_status': moisture_status,
-                                'temp_status': temp_status,     
-                                'timestamp': firestore.SERVER_TIMESTAMP
-                            })
-                            logger.info(f"Data uploaded to faminga_sensors/{HARDWARE_ID}")
-                            
-                            # Add to historical readings subcollection
-                            readings_ref = doc_ref.collection('readings')
-                            readings_ref.add({
-                                'userId': user_id,
-                                'fieldId': field_id,
-                                'moisture': round(moisture, 1),
-                                'temperature': round(temperature, 1),
-                                'moisture_status': moisture_status,
-                                'temp_status': temp_status,
-                                'timestamp': firestore.SERVER_TIMESTAMP
-                            })
-                            
-                            # Update session heartbeat
-                            update_heartbeat(HARDWARE_ID)
-                            
-                        except Exception as e:
-                            logger.error(f"Failed to upload to Firestore: {e}")
-
-                    # Log to CSV
-                    log_to_csv(moisture, temperature)
-
-                    logger.info(f"Read: {moisture:.1f}% moisture, {temperature:.1f}°C")
-                
-                except (serial.SerialException, PermissionError, OSError) as e:
-                    consecutive_errors += 1
-                    logger.error(f"Communication error ({consecutive_errors}/{max_consecutive_errors}): {e}")
-                    
-                    if consecutive_errors >= max_consecutive_errors:
-                        logger.error("Too many errors, reinitializing sensor...")
-                        with instrument_lock:
-                            if instrument and hasattr(instrument, 'serial'):
-                                try:
-                                    instrument.serial.close()
-                                except:
-                                    pass
-                            instrument = None
-                        consecutive_errors = 0
-                    
-                    with data_lock:
-                        latest_data["status"] = "error"
-                    time.sleep(2)
-                    continue
-                
-                except minimalmodbus.NoResponseError:
-                    consecutive_errors += 1
-                    logger.error(f"No response from sensor ({consecutive_errors}/{max_consecutive_errors})")
-                    if consecutive_errors >= max_consecutive_errors:
-                        with instrument_lock:
-                            instrument = None
-                    with data_lock:
-                        latest_data["status"] = "error"
-                    time.sleep(2)
-                    continue
-                
-                except minimalmodbus.InvalidResponseError as e:
-                    consecutive_errors += 1
-                    logger.error(f"Invalid response: {e}")
-                    if consecutive_errors >= max_consecutive_errors:
-                        with instrument_lock:
-                            instrument = None
-                    with data_lock:
-                        latest_data["status"] = "error"
-                    time.sleep(2)
-                    continue
+        device.schedule.wait()
+        if not device.run_cycle():
+            break
+
+def run_multi_sensor(configs):
+    """Drive many probes on one or more RS485 buses from this process."""
+    for config in configs:
+        add_device(config)
 
+    schedulers = build_bus_schedulers(devices.values())
+    for scheduler in schedulers:
+        scheduler.start()
+    logger.info(f"Managing {len(devices)} sensor(s) on {len(schedulers)} bus(es)")
+
+    # Assignment loop: hand sessions to idle devices, announce the rest.
+    # Session listeners wake it at once; the timeout only picks up devices
+    # released by their bus thread (cached lookups, no Firestore reads).
+    wake = threading.Event()
+    for device in devices.values():
+        device.session_cache.add_listener(lambda data: wake.set())
+    while True:
+        wake.clear()
+        for device in devices.values():
+            if device.assigned:
+                continue
+            session = device.session_cache.get()
+            if session:
+                device.assign(session.get('userId'), session.get('fieldId'))
+                logger.info(f"OK [{device.hardware_id}] Assigned to user {device.user_id}, field {device.field_id}")
             else:
-                # Sensor is stopped
-                with data_lock:
-                    latest_data["status"] = "stopped"
+                keep_presence(device.hardware_id, device.session_cache)
+        wake.wait(ASSIGNMENT_CHECK_INTERVAL)
 
-            time.sleep(5)  # Read every 5 seconds
+def run_async_service(configs, adb=None):
+    """Run acquisition, uploads, sessions and heartbeats as asyncio tasks (BLOCKING)."""
+    global uploader
+    from firebase_admin import firestore_async
+    from async_runtime import AsyncRuntime
+    from uploader import AsyncBatchUploader
 
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}", exc_info=True)
-            with data_lock:
-                latest_data["status"] = "error"
-            time.sleep(5)
+    adb = adb or firestore_async.client()
+    uploader = AsyncBatchUploader(adb, offline_queue=OfflineQueue(OFFLINE_QUEUE_FILE, MAX_OFFLINE_READINGS),
+                                  gateway=gateway)
+
+    for config in configs:
+        if config.hardware_id == HARDWARE_ID:
+            # Single-sensor mode keeps feeding the legacy /data state
+            add_device(config, state=latest_data)
+        else:
+            add_device(config)
+
+    runtime = AsyncRuntime(devices.values(), uploader, adb, announce_presence_async,
+                           presence_interval=ASSIGNMENT_CHECK_INTERVAL, presence_ttl=PRESENCE_TTL)
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
 
 # --- HTML page with Chart.js dashboard ---
 HTML_PAGE = """
@@ -525,12 +532,11 @@ HTML_PAGE = """
     <title>FAMINGA Soil Reader</title>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1">
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600;700&display=swap" rel="stylesheet">
+    <script src="/static/chart.umd.min.js"></script>
     <style>
         * { margin: 0; padding: 0; box-sizing: border-box; }
         body { 
-            font-family: 'Poppins', sans-serif;
+            font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif;
             background: #F5F5F5;
             padding: 20px;
             min-height: 100vh;
@@ -598,6 +604,8 @@ HTML_PAGE = """
         .status-dot.error { background: #ff4444; box-shadow: 0 0 10px #ff4444; }
         .status-dot.stopped { background: #FFA500; box-shadow: 0 0 10px #FFA500; }
         .status-dot.initializing { background: #0099ff; box-shadow: 0 0 10px #0099ff; }
+        .status-dot.offline { background: #888888; box-shadow: 0 0 10px #888888; }
+        .status-dot.waiting { background: #9966ff; box-shadow: 0 0 10px #9966ff; }
         
         @keyframes pulse {
             0%, 100% { transform: scale(1); opacity: 1; }
@@ -864,42 +872,71 @@ HTML_PAGE = """
             }
         });
 
+        function render(data) {
+            document.getElementById('moisture').textContent = data.moisture;
+            document.getElementById('temperature').textContent = data.temperature;
+            document.getElementById('moisture-status').textContent = data.moisture_status;
+            document.getElementById('temp-status').textContent = data.temp_status;
+            
+            const statusDot = document.getElementById('status-dot');
+            const statusText = document.getElementById('status-text');
+            statusDot.className = 'status-dot ' + data.status;
+            statusText.textContent = 'Status: ' + data.status.toUpperCase();
+            
+            const now = new Date();
+            document.getElementById('last-update').textContent = 
+                'Last Update: ' + now.toLocaleTimeString();
+            
+            if (data.status !== 'active' || data.timestamp === lastTimestamp) {
+                return;
+            }
+            lastTimestamp = data.timestamp;
+            const time = new Date(data.timestamp * 1000).toLocaleTimeString();
+            labels.push(time);
+            moistureData.push(data.moisture);
+            tempData.push(data.temperature);
+            
+            if (labels.length > 30) {
+                labels.shift();
+                moistureData.shift();
+                tempData.shift();
+            }
+            
+            chart.update('none');
+        }
+
+        let lastTimestamp = null;
+        let pollTimer = null;
+
         function updateData() {
             fetch('/data')
                 .then(r => r.json())
-                .then(data => {
-                    document.getElementById('moisture').textContent = data.moisture;
-                    document.getElementById('temperature').textContent = data.temperature;
-                    document.getElementById('moisture-status').textContent = data.moisture_status;
-                    document.getElementById('temp-status').textContent = data.temp_status;
-                    
-                    const statusDot = document.getElementById('status-dot');
-                    const statusText = document.getElementById('status-text');
-                    statusDot.className = 'status-dot ' + data.status;
-                    statusText.textContent = 'Status: ' + data.status.toUpperCase();
-                    
-                    const now = new Date();
-                    document.getElementById('last-update').textContent = 
-                        'Last Update: ' + now.toLocaleTimeString();
-                    
-                    const time = now.toLocaleTimeString();
-                    labels.push(time);
-                    moistureData.push(data.moisture);
-                    tempData.push(data.temperature);
-                    
-                    if (labels.length > 30) {
-                        labels.shift();
-                        moistureData.shift();
-                        tempData.shift();
-                    }
-                    
-                    chart.update('none');
-                })
+                .then(render)
                 .catch(err => {
                     console.error('Failed to fetch data:', err);
                 });
         }
 
+        function connectStream() {
+            if (!window.EventSource) {
+                pollTimer = pollTimer || setInterval(updateData, 5000);
+                return;
+            }
+            const source = new EventSource('/stream');
+            source.addEventListener('reading', e => render(JSON.parse(e.data)));
+            source.onerror = () => {
+                // Refused (client cap) or server gone: poll until the stream can be reopened
+                if (source.readyState === EventSource.CLOSED) {
+                    pollTimer = pollTimer || setInterval(updateData, 5000);
+                    setTimeout(() => {
+                        clearInterval(pollTimer);
+                        pollTimer = null;
+                        connectStream();
+                    }, 60000);
+                }
+            };
+        }
+
         function toggleSensor() {
             fetch('/toggle', {method: 'POST'})
                 .then(r => r.json())
@@ -911,58 +948,245 @@ HTML_PAGE = """
                 .catch(err => alert('❌ Failed to toggle sensor'));
         }
 
-        setInterval(updateData, 3000);
         updateData();
+        connectStream();
     </script>
 </body>
 </html>
 """
 
+def _prerender(html):
+    """Encode a static page once: raw and gzip bodies plus a content ETag."""
+    body = html.encode('utf-8')
+    return {
+        'body': body,
+        'gzip': gzip.compress(body, compresslevel=9),
+        'etag': hashlib.sha1(body).hexdigest(),
+    }
+
+DASHBOARD = _prerender(HTML_PAGE)
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_PAGE)
+    if request.if_none_match.contains(DASHBOARD['etag']):
+        response = Response(status=304)
+    elif request.accept_encodings['gzip']:
+        response = Response(DASHBOARD['gzip'], mimetype='text/html')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(DASHBOARD['body'], mimetype='text/html')
+    response.set_etag(DASHBOARD['etag'])
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _select_device():
+    """Device named by ?device=, else the default one (None = legacy single sensor)."""
+    hardware_id = request.args.get('device')
+    if not hardware_id and devices and HARDWARE_ID not in devices:
+        hardware_id = next(iter(devices))
+    if not hardware_id:
+        return None
+    if hardware_id not in devices:
+        raise KeyError(hardware_id)
+    return devices[hardware_id]
 
 @app.route('/data')
 def get_data():
     try:
-        with data_lock:
-            data = latest_data.copy()
-        return jsonify(data)
+        device = _select_device()
+        holder = latest_data if device is None else device.state
+        # Pre-encoded when the reading was taken: no lock, no serialization here
+        return Response(holder.current.json, mimetype='application/json')
+    except KeyError as e:
+        return jsonify({"error": f"Unknown device {e}"}), 404
     except Exception as e:
         logger.error(f"Error serving data: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route('/stream')
+def stream_data():
+    """Server-Sent Events: one `reading` event per state change (?device= as for /data)."""
+    try:
+        device = _select_device()
+    except KeyError as e:
+        return jsonify({"error": f"Unknown device {e}"}), 404
+
+    if device is None:
+        hardware_id = HARDWARE_ID
+        current = latest_data.current
+    else:
+        hardware_id = device.hardware_id
+        current = device.state.current
+
+    try:
+        client = broadcaster.subscribe(hardware_id)
+    except TooManyClients as e:
+        return jsonify({"error": str(e)}), 503
+
+    first = encode_event(current)
+    return Response(broadcaster.events(client, first), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/devices')
+def list_devices():
+    result = []
+    for device in list(devices.values()):
+        data = dict(device.state.current.data)
+        data.update({
+            "port": device.config.port,
+            "slave": device.config.slave,
+            "userId": device.user_id,
+            "fieldId": device.field_id,
+            "timing": device.schedule.stats(),
+            "health": device.breaker.stats(),
+        })
+        result.append(data)
+    return jsonify(result)
+
+# /history limits: default window and the most points one response may carry
+HISTORY_DEFAULT_HOURS = 24
+HISTORY_DEFAULT_POINTS = 500
+HISTORY_MAX_POINTS = 5000
+# LTTB keeps the first and last points plus at least one bucket in between
+HISTORY_MIN_POINTS = 3
+
+@app.route('/history')
+def get_history():
+    """Readings in [from, to) downsampled to at most `bucket` points (?method=lttb|minmax)."""
+    import history_query  # numpy; only needed once someone asks for history
+    if history_query.np is None:
+        return jsonify({"error": "numpy is required for /history"}), 503
+    try:
+        device = _select_device()
+        end = history_query.parse_time(request.args['to']) if 'to' in request.args else time.time()
+        start = history_query.parse_time(request.args['from']) if 'from' in request.args \
+            else end - HISTORY_DEFAULT_HOURS * 3600
+        points = request.args.get('bucket', HISTORY_DEFAULT_POINTS)
+        if not str(points).isdigit() or int(points) < HISTORY_MIN_POINTS:
+            raise ValueError(f"bucket must be an integer >= {HISTORY_MIN_POINTS}")
+        points = min(int(points), HISTORY_MAX_POINTS)
+        method = request.args.get('method', 'lttb')
+        if method not in ('lttb', 'minmax'):
+            raise ValueError(f"unknown method {method!r}")
+    except KeyError as e:
+        return jsonify({"error": f"Unknown device {e}"}), 404
+    except ValueError as e:
+        return jsonify({"error": f"Bad query: {e}"}), 400
+
+    try:
+        csv_file = CSV_FILE if device is None else device_csv_file(device.config)
+        store = history_stores.get(os.path.splitext(csv_file)[0] + '.bin')
+        if store is not None:
+            t, moisture, temperature = store.read(start, end)
+        else:
+            csv_logger = csv_loggers.get(csv_file)
+            if csv_logger is not None:
+                csv_logger.flush()
+            t, moisture, temperature = history_query.read_csv_range(csv_file, start, end)
+
+        count = len(t)
+        t, moisture, temperature = history_query.downsample(t, moisture, temperature, points, method)
+        return jsonify({
+            "from": start,
+            "to": end,
+            "count": count,
+            "method": method,
+            "t": t.tolist(),
+            "moisture": history_query.np.round(moisture.astype(float), 2).tolist(),
+            "temperature": history_query.np.round(temperature.astype(float), 2).tolist(),
+        })
+    except Exception as e:
+        logger.error(f"Error serving history: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of the pipeline metrics."""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/toggle', methods=['POST'])
 def toggle_sensor():
     global sensor_active
     try:
         sensor_active = not sensor_active
+        for device in list(devices.values()):
+            device.active = sensor_active
         logger.info(f"Sensor {'activated' if sensor_active else 'deactivated'}")
         return jsonify({"active": sensor_active})
     except Exception as e:
         logger.error(f"Error toggling sensor: {e}")
         return jsonify({"error": "Failed to toggle sensor"}), 500
 
+# A device counts as healthy if its last reading is younger than this (s)
+HEALTH_MAX_READING_AGE = 10
+
 @app.route('/health')
 def health_check():
-    with data_lock:
-        status = latest_data.get("status", "unknown")
-        timestamp = latest_data.get("timestamp")
-    is_healthy = status == "active" and timestamp and (time.time() - timestamp) < 10
+    """Healthy while at least one active device has read recently."""
+    now = time.time()
+    readings = {}
+    for device in list(devices.values()):
+        snapshot = device.state.current
+        timestamp = snapshot.get("timestamp")
+        # Allow slow sampling schedules two periods before calling them stale
+        fresh_for = max(HEALTH_MAX_READING_AGE, 2 * device.config.poll_interval)
+        readings[device.hardware_id] = {
+            "status": snapshot.get("status", "unknown"),
+            "last_reading": timestamp,
+            "fresh": bool(device.active and snapshot.get("status") == "active"
+                          and timestamp and now - timestamp < fresh_for),
+        }
+    if not readings:
+        # Nothing registered yet: fall back to the legacy single-sensor state
+        snapshot = latest_data.current
+        timestamp = snapshot.get("timestamp")
+        readings[snapshot.get("hardwareId") or "sensor"] = {
+            "status": snapshot.get("status", "unknown"),
+            "last_reading": timestamp,
+            "fresh": bool(snapshot.get("status") == "active" and timestamp
+                          and now - timestamp < HEALTH_MAX_READING_AGE),
+        }
+
+    is_healthy = any(reading["fresh"] for reading in readings.values())
+    timestamps = [reading["last_reading"] for reading in readings.values() if reading["last_reading"]]
     return jsonify({
         "status": "healthy" if is_healthy else "unhealthy",
         "sensor_active": sensor_active,
-        "last_reading": timestamp
+        "last_reading": max(timestamps) if timestamps else None,
+        "devices": readings,
+        "pending_uploads": uploader.pending() if uploader else 0,
+        "stream_clients": broadcaster.client_count,
+        "firestore": gateway.stats() if gateway else None
     }), 200 if is_healthy else 503
 
 
-def run_flask_app():
-    """Run Flask app serving the dashboard"""
+def run_flask_app(server='dev', host='0.0.0.0', port=2000, threads=16):
+    """Run Flask app serving the dashboard (Flask dev server or waitress)"""
     try:
-        app.run(host='0.0.0.0', port=2000, debug=False, use_reloader=False)
+        if server == 'waitress':
+            from waitress import serve
+            # Every /stream client holds a worker thread; keep some for requests
+            broadcaster.max_clients = min(broadcaster.max_clients, max(1, threads - 4))
+            logger.info(f"Serving dashboard with waitress on {host}:{port} ({threads} threads)")
+            serve(app, host=host, port=port, threads=threads, ident='faminga-sensor')
+        else:
+            app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
     except Exception as e:
         logger.error(f"Flask init failed: {e}")
 
+def int_range_arg(text):
+    """argparse type for "1-4,7" style lists: a usage error instead of a traceback."""
+    try:
+        values = discovery.parse_int_range(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected numbers or ranges like "1-4,7", got {text!r}')
+    if not values:
+        raise argparse.ArgumentTypeError(f'no values in {text!r}')
+    return values
+
 # --- Initialize and start ---
 # --- Initialize and start ---
 if __name__ == '__main__':
@@ -972,39 +1196,222 @@ if __name__ == '__main__':
     parser.add_argument('--user-id', help='Pre-claim User ID')
     parser.add_argument('--field-id', help='Pre-claim Field ID')
     parser.add_argument('--port', help='Override Serial Port')
+    parser.add_argument('--devices', help='JSON file of sensors to drive from this process (multi-sensor mode)')
+    parser.add_argument('--scan-slaves', type=int_range_arg, default='1',
+                        help='Slave addresses to probe, e.g. "1-4,7" (default: 1)')
+    parser.add_argument('--scan-baudrates', type=int_range_arg, default='9600',
+                        help='Baud rates to probe, e.g. "9600,4800" (default: 9600)')
+    parser.add_argument('--rescan', action='store_true', help='Ignore the cached port mapping and scan all ports')
+    parser.add_argument('--persistent-port', action='store_true', help='Keep the serial port open between reads')
+    parser.add_argument('--single-register-reads', action='store_true',
+                        help='Read moisture and temperature in two transactions (for probes without multi-register reads)')
+    parser.add_argument('--sample-interval', type=float, default=5.0, help='Seconds between Modbus reads (default: 5)')
+    parser.add_argument('--upload-interval', type=float, default=0,
+                        help='Upload one min/max/mean/stddev aggregate every N seconds instead of every sample '
+                             f'(max {MAX_UPLOAD_INTERVAL}; the CSV log keeps every sample)')
+    parser.add_argument('--report-by-exception', action='store_true',
+                        help='Only upload when a reading changes (see the deadband options)')
+    parser.add_argument('--moisture-deadband', type=float, help='Absolute moisture change (%%) that counts as a change')
+    parser.add_argument('--temperature-deadband', type=float, help='Absolute temperature change (°C) that counts as a change')
+    parser.add_argument('--deadband-percent', type=float, help='Relative change (%%) that counts as a change on either channel')
+    parser.add_argument('--keepalive', type=float, default=MAX_KEEPALIVE,
+                        help=f'Force an upload after this many seconds without one (max {MAX_KEEPALIVE})')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='Run acquisition, uploads and sessions on an asyncio event loop')
+    parser.add_argument('--csv-flush-interval', type=float, default=CSV_FLUSH_INTERVAL,
+                        help=f'Seconds between buffered CSV writes (default: {CSV_FLUSH_INTERVAL})')
+    parser.add_argument('--csv-fsync', action='store_true', help='fsync the CSV file after every flush')
+    parser.add_argument('--csv-max-mb', type=float, default=CSV_MAX_BYTES / (1024 * 1024),
+                        help='Rotate the CSV file at this size in MB (default: 5)')
+    parser.add_argument('--no-csv-compress', action='store_true', help='Keep rotated CSV files uncompressed')
+    parser.add_argument('--history-store', action='store_true',
+                        help='Also append readings to a binary history file (<csv name>.bin) for fast range queries; '
+                             'a new file is seeded from the existing CSV log')
+    parser.add_argument('--http-server', choices=['dev', 'waitress'], default='dev',
+                        help='Dashboard server: Flask dev server or waitress (production, multi-threaded)')
+    parser.add_argument('--http-host', default='0.0.0.0', help='Dashboard bind address (default: 0.0.0.0)')
+    parser.add_argument('--http-port', type=int, default=2000, help='Dashboard port (default: 2000)')
+    parser.add_argument('--http-threads', type=int, default=16, help='waitress worker threads (default: 16)')
+    parser.add_argument('--log-json', action='store_true', help='Write the log file as JSON lines')
+    parser.add_argument('--log-max-mb', type=float, default=5, help='Rotate sensor.log at this size in MB (default: 5)')
+    parser.add_argument('--log-backups', type=int, default=5, help='Rotated log files to keep (default: 5)')
+    parser.add_argument('--log-burst', type=int, default=5,
+                        help='Similar log messages allowed per minute before suppression, 0 = unlimited (default: 5)')
+    parser.add_argument('--debug', action='store_true', help='Log DEBUG messages')
+    parser.add_argument('--simulate', type=int, nargs='?', const=1, metavar='N',
+                        help='Run N simulated probes against an in-memory Firestore (no hardware or network)')
+    parser.add_argument('--sim-source', default='synthetic',
+                        help='Simulated signal: "synthetic" or "csv?file=sensor_data.csv" (default: synthetic)')
+    parser.add_argument('--sim-buses', type=int, default=1, help='Simulated RS485 buses to spread probes over (default: 1)')
+    parser.add_argument('--sim-faults', default='',
+                        help='Fault schedule, e.g. "no_response=0.05&corrupt=50&outage=100-130" (see simulator.py)')
+    parser.add_argument('--sim-firestore-latency', type=float, default=0.0, help='Seconds added to each simulated Firestore call')
+    parser.add_argument('--sim-firestore-failures', type=float, default=0.0,
+                        help='Probability that a simulated Firestore call fails (exercises the offline queue)')
+    parser.add_argument('--discover', action='store_true', help='Scan all ports, save and print the sensor inventory, then exit')
+    parser.add_argument('--import-time', action='store_true',
+                        help='Print the import cost of the service (startup path and deferred modules), then exit')
     
     args = parser.parse_args()
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+
+    if args.import_time:
+        print(import_time_report())
+        exit(0)
+
+    setup_logging(
+        LOG_FILE,
+        level=logging.DEBUG if args.debug else logging.INFO,
+        json_lines=args.log_json,
+        max_bytes=int(args.log_max_mb * 1024 * 1024),
+        backup_count=args.log_backups,
+        rate_burst=args.log_burst
+    )
+
+    CSV_FLUSH_INTERVAL = args.csv_flush_interval
+    CSV_FSYNC = args.csv_fsync
+    CSV_MAX_BYTES = int(args.csv_max_mb * 1024 * 1024)
+    CSV_COMPRESS = not args.no_csv_compress
+    ENABLE_HISTORY_STORE = args.history_store
+
+    deadband = None
+    if args.report_by_exception or args.moisture_deadband is not None or args.temperature_deadband is not None \
+            or args.deadband_percent is not None:
+        deadband = {
+            'moisture': {'abs': args.moisture_deadband, 'pct': args.deadband_percent},
+            'temperature': {'abs': args.temperature_deadband, 'pct': args.deadband_percent},
+        }
+
+    scan_slaves = args.scan_slaves
+    scan_baudrates = args.scan_baudrates
+
+    if args.discover:
+        inventory = discovery.discover(scan_slaves, scan_baudrates)
+        discovery.save_inventory(PORT_CACHE_FILE, inventory)
+        print(json.dumps({'devices': inventory}, indent=2))
+        exit(0 if inventory else 1)
+
+    # Start Web Server (Daemon) first: /data and /health answer while the rest comes up
+    flask_thread = threading.Thread(
+        target=run_flask_app,
+        args=(args.http_server, args.http_host, args.http_port, args.http_threads)
+    )
+    flask_thread.daemon = True
+    flask_thread.start()
+    logger.info(f"Web server started on port {args.http_port}")
+    mark_startup('web')
+
+    # Firebase (SDK import + client) comes up in the background, in parallel with discovery
+    startup_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+    firebase_ready = None
     
-    # 1. Hardware ID Detection
-    if args.hardware_id:
-        HARDWARE_ID = args.hardware_id
+    if args.simulate:
+        # Virtual probes and an in-memory Firestore: no hardware, no network
+        from simulator import InMemoryFirestore, claim_session
+        from firestore_gateway import FirestoreGateway
+        db = InMemoryFirestore(latency=args.sim_firestore_latency, fail_rate=args.sim_firestore_failures)
+        gateway = FirestoreGateway(db)
+        OFFLINE_QUEUE_FILE = "offline_queue_sim.db"
+        ENABLE_CSV_LOGGING = False
+        device_configs = []
+        for i in range(args.simulate):
+            bus = i % max(1, args.sim_buses)
+            port = f"sim:{args.sim_source}{'&' if '?' in args.sim_source else '?'}bus={bus}"
+            if args.sim_faults:
+                port += f"&{args.sim_faults}"
+            device_configs.append(DeviceConfig(
+                f"SIM-{i + 1:04d}", port,
+                slave=i // max(1, args.sim_buses) + 1,
+                poll_interval=args.sample_interval,
+                upload_interval=args.upload_interval,
+                deadband=deadband,
+                keepalive=args.keepalive
+            ))
+            claim_session(db, f"SIM-{i + 1:04d}", args.user_id or "sim-user", args.field_id or "sim-field")
+        logger.info(f"> Simulating {args.simulate} sensor(s) on {min(args.simulate, args.sim_buses)} bus(es)")
+    elif args.devices:
+        firebase_ready = startup_pool.submit(init_firebase)
+        # Multi-sensor mode: hardware IDs and ports come from the config file
+        try:
+            device_configs = load_device_configs(args.devices)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"ERR Invalid devices file {args.devices}: {e}")
+            exit(1)
+        logger.info(f"> Loaded {len(device_configs)} sensor(s) from {args.devices}")
     else:
-        HARDWARE_ID = get_unique_hardware_id()
-        logger.info(f"> Detected Hardware ID: {HARDWARE_ID}")
-
-    # 2. Port Detection
-    detected_port = args.port if args.port else scan_for_sensor_port()
-    if not detected_port:
-        logger.error("ERR No sensor found on any USB port!")
-        logger.info("Please check connections.")
-        time.sleep(5)
-        exit(1)
-        
-    logger.info(f"> Using Port: {detected_port}")
+        firebase_ready = startup_pool.submit(init_firebase)
+
+        # 1. Hardware ID Detection
+        if args.hardware_id:
+            HARDWARE_ID = args.hardware_id
+        else:
+            HARDWARE_ID = get_unique_hardware_id()
+            logger.info(f"> Detected Hardware ID: {HARDWARE_ID}")
+
+        # 2. Port Detection
+        if args.port:
+            detected = {'port': args.port, 'slave': 1, 'baudrate': 9600}
+        else:
+            detected = find_sensor(scan_slaves, scan_baudrates, use_cache=not args.rescan)
+        if not detected:
+            logger.error("ERR No sensor found on any USB port!")
+            logger.info("Please check connections.")
+            time.sleep(5)
+            exit(1)
+        detected_port = detected['port']
+            
+        logger.info(f"> Using Port: {detected_port}")
+
+        single_config = DeviceConfig(
+            HARDWARE_ID, detected_port,
+            slave=detected['slave'],
+            baudrate=detected['baudrate'],
+            poll_interval=args.sample_interval,
+            upload_interval=args.upload_interval,
+            deadband=deadband,
+            keepalive=args.keepalive,
+            csv_file=CSV_FILE,
+            block_read=not args.single_register_reads,
+            persistent=args.persistent_port,
+            serial_number=detected.get('serialNumber')
+        )
+        mark_startup('port')
+
+        # First value on the dashboard before Firebase and the session are up
+        warmup = SensorDevice(single_config, state=latest_data)
+        if warmup.prime():
+            mark_startup('first_reading')
+        warmup.disconnect()
     
     # 3. Firestore Init
+    if firebase_ready is not None:
+        firebase_ready.result()
+    startup_pool.shutdown(wait=False)
     if db is None:
         logger.error("ERR Cannot reach Firestore! Check firebase_key.json")
         exit(1)
-        
-    if ENABLE_CSV_LOGGING:
-        initialize_csv()
+    logger.info("Startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_phases.items()))
 
-    # Start Web Server (Daemon)
-    flask_thread = threading.Thread(target=run_flask_app)
-    flask_thread.daemon = True
-    flask_thread.start()
-    logger.info("Web server started on port 2000")
+    if args.asyncio:
+        if not (args.devices or args.simulate):
+            device_configs = [single_config]
+            if args.user_id and args.field_id and not get_active_session(HARDWARE_ID):
+                logger.info("Using CLI args to auto-create session...")
+                create_session(HARDWARE_ID, args.user_id, args.field_id)
+        run_async_service(device_configs, adb=db.async_client() if args.simulate else None)  # BLOCKING
+        exit(0)
+
+    from uploader import BatchUploader
+    uploader = BatchUploader(db, offline_queue=OfflineQueue(OFFLINE_QUEUE_FILE, MAX_OFFLINE_READINGS),
+                             gateway=gateway)
+    uploader.start()
+
+    if args.devices or args.simulate:
+        run_multi_sensor(device_configs)  # BLOCKING
+
+    session_cache = SessionCache(db, HARDWARE_ID, SESSION_TIMEOUT_MINUTES, gateway=gateway,
+                                 state_file=SESSION_STATE_FILE)
+    session_cache.start()
 
     # 4. Main Waiting Loop
     logger.info("=" * 60)
@@ -1013,10 +1420,10 @@ if __name__ == '__main__':
     logger.info("=" * 60)
 
     while True:
-        # Check for active session
-        session = get_active_session(HARDWARE_ID)
+        # Session claims arrive through the listener; no reads while waiting
+        session = session_cache.get()
         
-        if session and session.get('active'):
+        if session:
             # WE HAVE A SESSION!
             sensor_user_id = session.get('userId')
             sensor_field_id = session.get('fieldId')
@@ -1028,21 +1435,20 @@ if __name__ == '__main__':
             logger.info("=" * 60)
             
             # Reset error count
-            with data_lock:
-                latest_data["status"] = "initializing"
+            latest_data.update(status="initializing")
             
             # Start the main sensor loop (BLOCKING)
             # This will run until session is lost/invalid
             sensor_active = True
-            read_soil_sensor(detected_port, sensor_user_id, sensor_field_id) 
+            read_soil_sensor(detected_port, sensor_user_id, sensor_field_id, config=single_config)
             
             # If we return here, session was lost.
             logger.info("! Session ended or lost. Returning to waiting mode...")
             time.sleep(2)
             
         else:
-            # No session - Announce and wait
-            announce_presence(HARDWARE_ID)
+            # No session - Announce (slow TTL) and wait for a claim
+            keep_presence(HARDWARE_ID, session_cache)
             
             # Use CLI args if provided to auto-create (fallback for dev)
             if args.user_id and args.field_id:
@@ -1051,6 +1457,6 @@ if __name__ == '__main__':
                 time.sleep(1)
                 continue
                 
-            time.sleep(3) # Wait before polling again
+            session_cache.wait_for_session(PRESENCE_TTL)
 
 
@@ -0,0 +1,234 @@
+"""Local cache of a sensor's Firestore session document."""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+def session_age_minutes(session_data, now=None):
+    """Minutes since the session's lastHeartbeat, or None if it has none."""
+    last_heartbeat = session_data.get('lastHeartbeat')
+    if not last_heartbeat:
+        return None
+    now = now or datetime.now(timezone.utc)
+    heartbeat_time = last_heartbeat.replace(tzinfo=timezone.utc)
+    return (now - heartbeat_time).total_seconds() / 60
+
+
+def is_session_live(session_data, timeout_minutes):
+    """True if the session is active and its heartbeat has not timed out."""
+    if not session_data or not session_data.get('active', False):
+        return False
+    age_minutes = session_age_minutes(session_data)
+    return age_minutes is None or age_minutes <= timeout_minutes
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class SessionCache:
+    """Keep `sensor_sessions/{hardware_id}` in memory.
+
+    A Firestore `on_snapshot` listener pushes every change (claim, release,
+    revocation) into the cache, so `get()` is a local lookup instead of a
+    document read per sample. Expiry is evaluated locally from
+    `lastHeartbeat`, and the document is re-read with a plain `get()` only
+    when nothing has been heard from Firestore for `ttl` seconds.
+
+    Our own heartbeats cannot land during an outage, so heartbeats queued
+    locally (`note_heartbeat()`) also count as liveness, and an active
+    session never expires while the gateway reports Firestore offline.
+    Only the listener, a refresh or a release ends it then.
+
+    Idle loops block in `wait_for_session()` or register `add_listener()`
+    callbacks instead of polling, and use `presence_due()` to refresh
+    `unassigned_sensors` on a slow TTL.
+
+    With a `state_file` the last live session is also kept on disk, so a
+    restarted service resumes sampling at once; the listener confirms or
+    revokes it when Firestore answers.
+    """
+
+    def __init__(self, db, hardware_id, timeout_minutes, ttl=300, gateway=None, state_file=None):
+        if gateway is None:
+            from firestore_gateway import FirestoreGateway
+            gateway = FirestoreGateway(db)
+        self.db = db
+        self.gateway = gateway
+        self.hardware_id = hardware_id
+        self.timeout_minutes = timeout_minutes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._data = None
+        self._heartbeat_at = None  # UTC time of the last heartbeat queued locally
+        self._checked_at = None  # monotonic time of the last snapshot or read attempt
+        self._watch = None
+        self._listeners = []
+        self._presence_at = None  # monotonic time of the last presence announce while idle
+        self.state_file = state_file
+        if state_file:
+            self._restore()
+
+    @property
+    def doc_ref(self):
+        return self.db.collection('sensor_sessions').document(self.hardware_id)
+
+    def start(self):
+        """Attach the snapshot listener (falls back to TTL polling if it fails)."""
+        if self.db is None or self._watch is not None:
+            return
+        try:
+            self._watch = self.doc_ref.on_snapshot(self._on_snapshot)
+            logger.info(f"Listening for session changes on sensor_sessions/{self.hardware_id}")
+        except Exception as e:
+            logger.warning(f"Session listener unavailable, using TTL refresh: {e}")
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                logger.warning(f"Error stopping session listener: {e}")
+            self._watch = None
+
+    def _live(self, data):
+        """is_session_live(), counting local heartbeats and never expiring while offline."""
+        if not data or not data.get('active', False):
+            return False
+        if not self.gateway.online:
+            return True
+        age_minutes = session_age_minutes(data)
+        if age_minutes is None or age_minutes <= self.timeout_minutes:
+            return True
+        heartbeat_at = self._heartbeat_at
+        return heartbeat_at is not None and \
+            session_age_minutes({'lastHeartbeat': heartbeat_at}) <= self.timeout_minutes
+
+    def note_heartbeat(self):
+        """Record that a heartbeat was queued for upload (it may land much later)."""
+        self._heartbeat_at = datetime.now(timezone.utc)
+
+    def _on_snapshot(self, doc_snapshots, changes, read_time):
+        # A deleted (released) session arrives as an empty snapshot list
+        data = None
+        for doc in doc_snapshots:
+            if doc.exists:
+                data = doc.to_dict()
+        self._store(data)
+
+    def _store(self, data):
+        with self._changed:
+            self._data = data
+            self._checked_at = time.monotonic()
+            if self._live(data):
+                # Claimed: the next idle stretch starts with a full announce
+                self._presence_at = None
+            self._changed.notify_all()
+        if self.state_file:
+            self._save(data)
+        for callback in list(self._listeners):
+            callback(data)
+
+    def _save(self, data):
+        """Keep the live session on disk (removed once it ends)."""
+        try:
+            if not self._live(data):
+                if os.path.exists(self.state_file):
+                    os.remove(self.state_file)
+                return
+            tmp_path = self.state_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'hardwareId': self.hardware_id, 'session': data}, f, default=_json_default)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save session state to {self.state_file}: {e}")
+
+    def _restore(self):
+        """Seed the cache with the session saved by a previous run, if it is still live."""
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable session state {self.state_file}: {e}")
+            return
+        if saved.get('hardwareId') != self.hardware_id:
+            return
+        data = saved.get('session') or {}
+        for key in ('lastHeartbeat', 'claimedAt'):
+            if isinstance(data.get(key), str):
+                data[key] = datetime.fromisoformat(data[key])
+        if is_session_live(data, self.timeout_minutes):
+            self._data = data
+            self._checked_at = time.monotonic()
+            logger.info(f"Restored session for {self.hardware_id} from {self.state_file}: "
+                        f"user={data.get('userId')}, field={data.get('fieldId')}")
+
+    def add_listener(self, callback):
+        """Call `callback(data)` (from the listener thread) whenever the document is stored."""
+        self._listeners.append(callback)
+
+    def wait_for_session(self, timeout, poll_interval=3):
+        """Block until a live session is cached or `timeout` s pass; returns get().
+
+        With the snapshot listener this wakes as soon as the app claims the
+        sensor and costs no reads. Without it, the document is re-read every
+        `poll_interval` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        if self._watch is None:
+            while self.get() is None and time.monotonic() < deadline:
+                time.sleep(min(poll_interval, max(0.0, deadline - time.monotonic())))
+                self.refresh()
+            return self.get()
+        with self._changed:
+            self._changed.wait_for(lambda: self._live(self._data), timeout)
+        return self.get()
+
+    def presence_due(self, ttl):
+        """True if the idle sensor should announce itself: never yet, or `ttl` s ago."""
+        return self._presence_at is None or time.monotonic() - self._presence_at >= ttl
+
+    @property
+    def presence_announced(self):
+        """A full presence document was written during the current idle stretch."""
+        return self._presence_at is not None
+
+    def mark_presence(self):
+        self._presence_at = time.monotonic()
+
+    def refresh(self):
+        """Re-read the session document directly."""
+        if self.db is None:
+            return
+        try:
+            # One attempt: a sampling cycle must not stall on retries during an outage
+            doc = self.gateway.call('session_refresh', self.doc_ref.get, attempts=1)
+            self._store(doc.to_dict() if doc.exists else None)
+        except Exception as e:
+            # Keep sampling on the cached copy and retry after ttl
+            logger.error(f"Failed to refresh session: {e}")
+            with self._lock:
+                self._checked_at = time.monotonic()
+
+    def get(self):
+        """Return the session data if it is active and unexpired, else None."""
+        with self._lock:
+            stale = self._checked_at is None or time.monotonic() - self._checked_at > self.ttl
+        if stale:
+            self.refresh()
+
+        with self._lock:
+            data = self._data
+        if not self._live(data):
+            return None
+        return data
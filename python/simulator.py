@@ -0,0 +1,484 @@
+"""Simulated Modbus probes and an in-memory Firestore for running without hardware.
+
+A device whose port starts with ``sim:`` is driven by a SimulatedInstrument
+instead of minimalmodbus::
+
+    sim:synthetic                        diurnal temperature, drying soil, irrigation
+    sim:csv?file=sensor_data.csv         replay a CSV log (looped)
+    sim:synthetic?no_response=0.05       5% of reads get no response
+    sim:synthetic?corrupt=20             every 20th read returns a corrupted frame
+    sim:synthetic?outage=100-130         reads 100..130 fail (probe unplugged)
+
+Fault parameters (no_response, timeout, corrupt, serial_error) are a
+probability when below 1 and "every Nth read" otherwise. `latency` sets
+the transaction time in seconds and `seed` fixes the random stream, so a
+given port string always produces the same sequence.
+"""
+import asyncio
+import csv
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+import minimalmodbus
+import serial
+from firebase_admin import firestore
+from google.api_core import exceptions as gexc
+
+logger = logging.getLogger(__name__)
+
+SIM_PREFIX = 'sim:'
+FAULT_KINDS = ('no_response', 'timeout', 'corrupt', 'serial_error')
+
+
+# --- Signal sources (values in engineering units) ---
+
+class SyntheticSource:
+    """Soil that dries out over the day and is irrigated when it gets too dry."""
+
+    def __init__(self, rng, sample_interval=5.0):
+        self.rng = rng
+        self.sample_interval = sample_interval
+        self.step = 0
+        self.moisture = rng.uniform(35, 55)
+        self.phase = rng.uniform(0, 2 * math.pi)
+
+    def next(self):
+        hours = self.step * self.sample_interval / 3600.0
+        self.step += 1
+        temperature = 22 + 8 * math.sin(2 * math.pi * hours / 24 + self.phase) + self.rng.gauss(0, 0.2)
+        # Evaporation grows with temperature
+        self.moisture -= max(0.0, 0.0004 * (temperature - 5)) * self.sample_interval / 5
+        if self.moisture < 25 and self.rng.random() < 0.05:
+            self.moisture += self.rng.uniform(20, 35)  # irrigation event
+        self.moisture = min(max(self.moisture, 0.0), 100.0)
+        return self.moisture + self.rng.gauss(0, 0.3), temperature
+
+
+class CsvSource:
+    """Replay the moisture/temperature columns of a CSV log, looping at the end."""
+
+    def __init__(self, path):
+        with open(path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            self.rows = [(float(r[1]), float(r[2])) for r in reader if len(r) >= 3]
+        if not self.rows:
+            raise ValueError(f"No readings in {path}")
+        self._cycle = itertools.cycle(self.rows)
+
+    def next(self):
+        return next(self._cycle)
+
+
+# --- Simulated transport ---
+
+class SimulatedSerial:
+    """The subset of serial.Serial that SensorDevice touches."""
+
+    def __init__(self):
+        self.baudrate = 9600
+        self.bytesize = 8
+        self.parity = serial.PARITY_NONE
+        self.stopbits = 1
+        self.timeout = 1.0
+        self.is_open = False
+
+    def close(self):
+        self.is_open = False
+
+
+class FaultPlan:
+    """Decide, per read index, which fault (if any) to inject."""
+
+    def __init__(self, rng, rates=None, outage=None):
+        self.rng = rng
+        self.rates = rates or {}
+        self.outage = outage
+
+    def fault_for(self, index):
+        if self.outage and self.outage[0] <= index <= self.outage[1]:
+            return 'no_response'
+        for kind in FAULT_KINDS:
+            rate = self.rates.get(kind)
+            if not rate:
+                continue
+            if rate >= 1:
+                if index % int(rate) == 0:
+                    return kind
+            elif self.rng.random() < rate:
+                return kind
+        return None
+
+
+class SimulatedInstrument:
+    """Stand-in for minimalmodbus.Instrument serving registers 0 (moisture) and 1 (temperature)."""
+
+    def __init__(self, source, faults=None, latency=0.02, slave=1):
+        self.source = source
+        self.faults = faults or FaultPlan(random.Random(0))
+        self.latency = latency
+        self.address = slave
+        self.serial = SimulatedSerial()
+        self.close_port_after_each_call = True
+        self.settle_time = 0  # no warm-up delay after (re)connecting
+        self.clear_buffers_before_each_transaction = True
+        self.reads = 0
+        self._lock = threading.Lock()
+        self._pending_temperature = None
+
+    @classmethod
+    def from_port(cls, port, slave=1):
+        """Build an instrument from a ``sim:<kind>?<params>`` port string."""
+        kind, _, query = port[len(SIM_PREFIX):].partition('?')
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        seed = int(params['seed']) if 'seed' in params else zlib.crc32(f"{port}/{slave}".encode())
+        rng = random.Random(seed)
+
+        if kind in ('', 'synthetic'):
+            source = SyntheticSource(rng, float(params.get('interval', 5.0)))
+        elif kind == 'csv':
+            source = CsvSource(params.get('file', 'sensor_data.csv'))
+        else:
+            raise ValueError(f"Unknown simulated source {kind!r}")
+
+        rates = {k: float(params[k]) for k in FAULT_KINDS if k in params}
+        outage = None
+        if 'outage' in params:
+            start, _, end = params['outage'].partition('-')
+            outage = (int(start), int(end or start))
+        return cls(source, FaultPlan(rng, rates, outage), float(params.get('latency', 0.02)), slave)
+
+    def _transaction(self):
+        """Advance one read and raise the scheduled fault, if any."""
+        with self._lock:
+            self.reads += 1
+            index = self.reads
+        fault = self.faults.fault_for(index)
+        if fault == 'timeout':
+            time.sleep(self.serial.timeout)
+            raise minimalmodbus.NoResponseError("No communication with the instrument (no answer)")
+        if self.latency:
+            time.sleep(self.latency)
+        if fault == 'no_response':
+            raise minimalmodbus.NoResponseError("No communication with the instrument (no answer)")
+        if fault == 'corrupt':
+            raise minimalmodbus.InvalidResponseError("CRC error: simulated corrupted frame")
+        if fault == 'serial_error':
+            raise serial.SerialException("Simulated serial port failure")
+
+    def read_registers(self, registeraddress, number_of_registers, functioncode=3):
+        self._transaction()
+        moisture, temperature = self.source.next()
+        values = [int(round(moisture * 10)), int(round(temperature * 10))]
+        return values[registeraddress:registeraddress + number_of_registers]
+
+    def read_register(self, registeraddress, number_of_decimals=0, functioncode=3, signed=False):
+        self._transaction()
+        if registeraddress == 0:
+            moisture, self._pending_temperature = self.source.next()
+            return int(round(moisture * 10))
+        if self._pending_temperature is None:
+            _, self._pending_temperature = self.source.next()
+        temperature, self._pending_temperature = self._pending_temperature, None
+        return int(round(temperature * 10))
+
+
+_instruments = {}
+_instruments_lock = threading.Lock()
+
+
+def open_simulated(port, slave=1):
+    """The simulated probe at (port, slave); reconnecting returns the same probe.
+
+    Like a physical sensor, its signal and read counter (and thus the fault
+    schedule) carry on across reconnects.
+    """
+    with _instruments_lock:
+        instrument = _instruments.get((port, slave))
+        if instrument is None:
+            instrument = SimulatedInstrument.from_port(port, slave)
+            _instruments[(port, slave)] = instrument
+        instrument.serial.is_open = False
+        return instrument
+
+
+# --- In-memory Firestore ---
+
+def _resolve(value, now):
+    if value is firestore.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, dict):
+        return {k: _resolve(v, now) for k, v in value.items()}
+    return value
+
+
+class _Snapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _Watch:
+    def __init__(self, db, path, callback):
+        self._db = db
+        self._path = path
+        self._callback = callback
+
+    def unsubscribe(self):
+        self._db._unwatch(self._path, self._callback)
+
+
+class DocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return CollectionReference(self._db, f"{self.path}/{name}")
+
+    def get(self, retry=None, timeout=None):
+        self._db._tick(timeout)
+        return _Snapshot(self, self._db._read(self.path))
+
+    def set(self, data, merge=False, retry=None, timeout=None):
+        self._db._tick(timeout)
+        self._db._write(self.path, data, merge=merge)
+
+    def update(self, data, retry=None, timeout=None):
+        self._db._tick(timeout)
+        self._db._write(self.path, data, must_exist=True)
+
+    def delete(self, retry=None, timeout=None):
+        self._db._tick(timeout)
+        self._db._delete(self.path)
+
+    def on_snapshot(self, callback):
+        return self._db._watch(self.path, callback, self)
+
+
+class CollectionReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+
+    def document(self, document_id=None):
+        return DocumentReference(self._db, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def stream(self):
+        prefix = self.path + '/'
+        for path in self._db._paths(prefix):
+            yield _Snapshot(DocumentReference(self._db, path), self._db._read(path))
+
+
+class WriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference.path, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(('update', reference.path, data, False))
+
+    def commit(self, retry=None, timeout=None):
+        """Apply every write, or none if an update targets a missing document."""
+        self._db._tick(timeout)
+        self._db._apply(self._ops)
+        return []
+
+
+class InMemoryFirestore:
+    """Dict-backed stand-in for the Firestore client used by the sensor service.
+
+    Supports documents, subcollections, batches, `on_snapshot` listeners and
+    SERVER_TIMESTAMP. `latency` adds a delay per call (DeadlineExceeded if it
+    is longer than the call's `timeout`) and `fail_rate` makes calls raise
+    ServiceUnavailable, to exercise the offline queue.
+    """
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.offline = False
+        self.writes = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._watchers = {}
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def _latency(self, timeout):
+        """(seconds the call takes, True if that runs past `timeout`)."""
+        if timeout is not None and self.latency > timeout:
+            return timeout, True
+        return self.latency, False
+
+    def _inject_failure(self, late):
+        if late:
+            raise gexc.DeadlineExceeded("Simulated Firestore deadline exceeded")
+        if self.offline or (self.fail_rate and self._rng.random() < self.fail_rate):
+            raise gexc.ServiceUnavailable("Simulated Firestore outage")
+
+    def _tick(self, timeout=None):
+        delay, late = self._latency(timeout)
+        if delay:
+            time.sleep(delay)
+        self._inject_failure(late)
+
+    async def _tick_async(self, timeout=None):
+        """_tick() for the async client: waits without blocking the event loop."""
+        delay, late = self._latency(timeout)
+        if delay:
+            await asyncio.sleep(delay)
+        self._inject_failure(late)
+
+    def _read(self, path):
+        with self._lock:
+            data = self._docs.get(path)
+            return dict(data) if data is not None else None
+
+    def _paths(self, prefix):
+        with self._lock:
+            depth = prefix.count('/')
+            return [p for p in self._docs if p.startswith(prefix) and p.count('/') == depth]
+
+    def _write(self, path, data, merge=False, must_exist=False):
+        self._apply([('update' if must_exist else 'set', path, data, merge)])
+
+    def _apply(self, ops):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for kind, path, _, _ in ops:
+                if kind == 'update' and path not in self._docs:
+                    raise gexc.NotFound(f"No document to update: {path}")
+            changed = []
+            for kind, path, data, merge in ops:
+                data = _resolve(data, now)
+                if kind == 'update' or merge:
+                    self._docs[path] = {**self._docs.get(path, {}), **data}
+                else:
+                    self._docs[path] = dict(data)
+                self.writes += 1
+                changed.append(path)
+        for path in changed:
+            self._notify(path)
+
+    def _delete(self, path):
+        with self._lock:
+            self._docs.pop(path, None)
+        self._notify(path)
+
+    def _watch(self, path, callback, reference):
+        with self._lock:
+            self._watchers.setdefault(path, []).append(callback)
+        data = self._read(path)
+        callback([_Snapshot(reference, data)] if data is not None else [], [], datetime.now(timezone.utc))
+        return _Watch(self, path, callback)
+
+    def _unwatch(self, path, callback):
+        with self._lock:
+            callbacks = self._watchers.get(path, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def _notify(self, path):
+        with self._lock:
+            callbacks = list(self._watchers.get(path, ()))
+        if not callbacks:
+            return
+        data = self._read(path)
+        reference = DocumentReference(self, path)
+        snapshots = [_Snapshot(reference, data)] if data is not None else []
+        for callback in callbacks:
+            callback(snapshots, [], datetime.now(timezone.utc))
+
+    def async_client(self):
+        """A firestore_async-style view of the same data."""
+        return AsyncInMemoryFirestore(self)
+
+
+class _AsyncDocument:
+    def __init__(self, reference):
+        self._reference = reference
+
+    def collection(self, name):
+        return _AsyncCollection(self._reference.collection(name))
+
+    async def get(self, retry=None, timeout=None):
+        reference = self._reference
+        await reference._db._tick_async(timeout)
+        return _Snapshot(reference, reference._db._read(reference.path))
+
+    async def set(self, data, merge=False, retry=None, timeout=None):
+        await self._reference._db._tick_async(timeout)
+        self._reference._db._write(self._reference.path, data, merge=merge)
+
+    async def update(self, data, retry=None, timeout=None):
+        await self._reference._db._tick_async(timeout)
+        self._reference._db._write(self._reference.path, data, must_exist=True)
+
+
+class _AsyncCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def document(self, document_id=None):
+        return _AsyncDocument(self._collection.document(document_id))
+
+
+class _AsyncBatch:
+    def __init__(self, db):
+        self._batch = WriteBatch(db)
+
+    def set(self, reference, data, merge=False):
+        self._batch.set(reference._reference, data, merge)
+
+    def update(self, reference, data):
+        self._batch.update(reference._reference, data)
+
+    async def commit(self, retry=None, timeout=None):
+        await self._batch._db._tick_async(timeout)
+        self._batch._db._apply(self._batch._ops)
+        return []
+
+
+class AsyncInMemoryFirestore:
+    def __init__(self, db):
+        self._db = db
+
+    def collection(self, name):
+        return _AsyncCollection(self._db.collection(name))
+
+    def batch(self):
+        return _AsyncBatch(self._db)
+
+
+def claim_session(db, hardware_id, user_id, field_id):
+    """Write an active session, as the app would (not subject to injected failures)."""
+    db._write(f"sensor_sessions/{hardware_id}", {
+        'userId': user_id,
+        'fieldId': field_id,
+        'active': True,
+        'claimedAt': firestore.SERVER_TIMESTAMP,
+        'lastHeartbeat': firestore.SERVER_TIMESTAMP,
+    })
@@ -0,0 +1,39 @@
+"""Immutable, pre-serialized sensor state published without reader locks."""
+import json
+import threading
+from types import MappingProxyType
+
+
+class Snapshot:
+    """Read-only sensor state plus its JSON encoding, built once per update."""
+
+    __slots__ = ('data', 'json')
+
+    def __init__(self, data):
+        self.data = MappingProxyType(dict(data))
+        self.json = json.dumps(data).encode('utf-8')
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+
+class SnapshotHolder:
+    """The latest Snapshot of one sensor, replaced atomically.
+
+    Readers load `current` (a single reference read) and never lock.
+    Writers build a new Snapshot and swap it in; the write lock only
+    orders concurrent writers so that no update is lost.
+    """
+
+    def __init__(self, **initial):
+        self._write_lock = threading.Lock()
+        self.current = Snapshot(initial)
+
+    def update(self, **changes):
+        """Publish a copy of the current state with `changes` applied; returns it."""
+        with self._write_lock:
+            data = dict(self.current.data)
+            data.update(changes)
+            snapshot = Snapshot(data)
+            self.current = snapshot
+        return snapshot
@@ -0,0 +1,85 @@
+"""Server-Sent Events fan-out of sensor readings to dashboard clients."""
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyClients(Exception):
+    pass
+
+
+def encode_event(snapshot, event='reading'):
+    """One SSE message carrying a Snapshot's pre-encoded JSON."""
+    return b"event: " + event.encode('ascii') + b"\ndata: " + snapshot.json + b"\n\n"
+
+
+class Broadcaster:
+    """Push each reading, serialized once (Snapshot.json), to every subscribed client.
+
+    Every client owns a small bounded queue; a client that cannot keep up
+    loses its oldest messages instead of slowing down the publisher or the
+    other clients. At most `max_clients` streams are open at a time.
+    """
+
+    def __init__(self, max_clients=10, client_queue=16, keepalive=15):
+        self.max_clients = max_clients
+        self.client_queue = client_queue
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def subscribe(self, hardware_id=None):
+        """Register a client for one device (None = all). Raises TooManyClients."""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                raise TooManyClients(f"{self.max_clients} stream clients already connected")
+            client = queue.Queue(maxsize=self.client_queue)
+            self._clients[client] = hardware_id
+        logger.info(f"Stream client connected ({len(self._clients)} open)")
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.pop(client, None)
+        logger.info(f"Stream client disconnected ({len(self._clients)} open)")
+
+    def publish(self, hardware_id, snapshot):
+        """Queue one message, built from the snapshot's JSON, for every interested client."""
+        with self._lock:
+            targets = [c for c, wanted in self._clients.items() if wanted in (None, hardware_id)]
+        if not targets:
+            return
+        message = encode_event(snapshot)
+        for client in targets:
+            _put_latest(client, message)
+
+    def events(self, client, first=None):
+        """Generator of SSE bytes for one client; unsubscribes when the client goes away."""
+        try:
+            if first is not None:
+                yield first
+            while True:
+                try:
+                    yield client.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(client)
+
+
+def _put_latest(client, message):
+    while True:
+        try:
+            client.put_nowait(message)
+            return
+        except queue.Full:
+            try:
+                client.get_nowait()
+            except queue.Empty:
+                pass
@@ -0,0 +1,45 @@
+from aggregation import MAX_UPLOAD_INTERVAL, Aggregator, RingBuffer, summarize
+
+
+def test_window_is_due_after_upload_interval():
+    aggregator = Aggregator(sample_interval=1, upload_interval=10)
+    assert not aggregator.due(0)
+    for second in range(10):
+        aggregator.add(40.0 + second, 20.0, second)
+        assert not aggregator.due(second)
+    aggregator.add(50.0, 20.0, 10)
+    assert aggregator.due(10)
+
+    summary = aggregator.flush(10)
+    assert summary['sampleCount'] == 11
+    assert summary['windowSeconds'] == 10
+    assert summary['moisture'] == {'min': 40.0, 'max': 50.0, 'mean': 45.0, 'stddev': 3.162}
+    assert summary['temperature']['stddev'] == 0
+
+    # flush() starts a new, empty window
+    assert not aggregator.due(100)
+    assert aggregator.flush(100) is None
+
+
+def test_long_window_summarizes_the_newest_samples_only():
+    aggregator = Aggregator(sample_interval=1, upload_interval=4)
+    for second in range(20):
+        aggregator.add(float(second), 20.0, 0)
+    summary = aggregator.flush(4)
+    assert summary['sampleCount'] == 20
+    assert summary['moisture']['min'] == 15.0
+    assert summary['moisture']['max'] == 19.0
+
+
+def test_upload_interval_is_capped():
+    assert Aggregator(1, 10 * MAX_UPLOAD_INTERVAL).upload_interval == MAX_UPLOAD_INTERVAL
+
+
+def test_ring_buffer_keeps_oldest_first_order():
+    ring = RingBuffer(3)
+    for value in range(5):
+        ring.append(value)
+    assert list(ring.values()) == [2.0, 3.0, 4.0]
+    ring.clear()
+    assert len(ring) == 0
+    assert summarize(ring.values()) is None
@@ -0,0 +1,52 @@
+import os
+import threading
+from datetime import datetime
+
+import pytest
+
+from csv_logger import CsvLogger, load_index
+
+
+def _write_across_midnight(path, compress):
+    csv_log = CsvLogger(str(path), flush_interval=0, compress=compress)
+    csv_log.write(40.0, 20.0, datetime(2025, 1, 1, 23, 59))
+    csv_log.write(41.0, 21.0, datetime(2025, 1, 2, 0, 1))
+    csv_log.close()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_daily_rotation_updates_index(tmp_path, compress):
+    path = tmp_path / 'sensor_data.csv'
+    # Rotation must not deadlock on the logger's own lock
+    worker = threading.Thread(target=_write_across_midnight, args=(path, compress), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive()
+
+    index = load_index(str(tmp_path / 'sensor_data.index.json'))
+    assert len(index) == 1
+    entry = index[0]
+    assert entry['rows'] == 1
+    assert entry['start'] == '2025-01-01T23:59:00'
+    assert entry['file'].endswith('.csv.gz' if compress else '.csv')
+    assert os.path.exists(tmp_path / entry['file'])
+
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines == ['timestamp,moisture,temperature', '2025-01-02T00:01:00,41.0,21.0']
+
+
+def test_rotated_file_is_indexed_before_compression(tmp_path):
+    path = tmp_path / 'sensor_data.csv'
+    csv_log = CsvLogger(str(path), flush_interval=0, compress=True)
+    csv_log.write(40.0, 20.0, datetime(2025, 1, 1, 23, 59))
+    csv_log.write(41.0, 21.0, datetime(2025, 1, 2, 0, 1))
+    try:
+        # Listed as soon as write() returns, whether or not gzip has finished
+        index = load_index(str(tmp_path / 'sensor_data.index.json'))
+        assert [entry['rows'] for entry in index] == [1]
+    finally:
+        csv_log.close()
+    index = load_index(str(tmp_path / 'sensor_data.index.json'))
+    assert index[0]['file'] == 'sensor_data-20250101T235900.csv.gz'
+    assert not os.path.exists(tmp_path / 'sensor_data-20250101T235900.csv')
@@ -0,0 +1,41 @@
+from deadband import MAX_KEEPALIVE, Deadband
+
+
+def test_reports_first_reading_and_changes_beyond_the_band():
+    deadband = Deadband({'moisture': {'abs': 0.5}}, keepalive=30)
+    assert deadband.should_report({'moisture': 40.0}, 0)
+    deadband.mark_reported({'moisture': 40.0}, 0)
+
+    assert not deadband.should_report({'moisture': 40.4}, 5)
+    assert deadband.should_report({'moisture': 40.6}, 10)
+    assert deadband.suppressed == 1
+
+
+def test_percent_band_is_relative_to_the_last_report():
+    deadband = Deadband({'temperature': {'pct': 5}})
+    deadband.mark_reported({'temperature': 20.0}, 0)
+    assert not deadband.should_report({'temperature': 20.9}, 1)
+    assert deadband.should_report({'temperature': 21.1}, 2)
+
+
+def test_channel_without_limits_reports_any_change():
+    deadband = Deadband({'moisture': {'abs': 1}})
+    deadband.mark_reported({'moisture': 40.0, 'status': 'ok'}, 0)
+    assert not deadband.should_report({'moisture': 40.0, 'status': 'ok'}, 1)
+    assert deadband.should_report({'moisture': 40.0, 'status': 'dry'}, 2)
+
+
+def test_keepalive_forces_a_report_and_is_capped():
+    deadband = Deadband({'moisture': {'abs': 5}}, keepalive=30)
+    deadband.mark_reported({'moisture': 40.0}, 0)
+    assert not deadband.should_report({'moisture': 40.0}, 29)
+    assert deadband.should_report({'moisture': 40.0}, 30)
+
+    assert Deadband(keepalive=10 * MAX_KEEPALIVE).keepalive == MAX_KEEPALIVE
+
+
+def test_reset_reports_the_next_reading():
+    deadband = Deadband({'moisture': {'abs': 5}})
+    deadband.mark_reported({'moisture': 40.0}, 0)
+    deadband.reset()
+    assert deadband.should_report({'moisture': 40.0}, 1)
@@ -0,0 +1,75 @@
+import random
+import types
+
+import pytest
+from google.api_core import exceptions as gexc
+
+import firestore_gateway
+from firestore_gateway import FirestoreGateway, FirestoreOffline
+from simulator import InMemoryFirestore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    fake_time = types.SimpleNamespace(monotonic=lambda: now[0], perf_counter=lambda: now[0],
+                                      sleep=lambda seconds: None)
+    monkeypatch.setattr(firestore_gateway, 'time', fake_time)
+    return now
+
+
+def _gateway(db):
+    return FirestoreGateway(db, attempts=2, failure_threshold=2, rng=random.Random(0))
+
+
+def test_transient_errors_are_retried(clock):
+    db = InMemoryFirestore()
+    gateway = _gateway(db)
+    answers = [gexc.ServiceUnavailable('blip'), 'ok']
+
+    def flaky(retry=None, timeout=None):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert gateway.call('op', flaky) == 'ok'
+    assert gateway.online
+
+
+def test_offline_calls_fail_fast_until_a_probe_answers(clock):
+    db = InMemoryFirestore()
+    db.offline = True
+    gateway = _gateway(db)
+    doc = db.collection('c').document('d')
+
+    for _ in range(2):
+        with pytest.raises(gexc.ServiceUnavailable):
+            gateway.call('op', doc.get)
+    assert not gateway.online
+
+    calls = []
+    with pytest.raises(FirestoreOffline):
+        gateway.call('op', lambda **kwargs: calls.append(kwargs))
+    assert calls == []
+
+    # The next probe is due after the breaker's backoff; it answers once the link is back
+    db.offline = False
+    clock[0] += 60
+    doc.set({'x': 1})
+    assert gateway.call('op', doc.get).to_dict() == {'x': 1}
+    assert gateway.online
+
+
+def test_non_transient_errors_are_not_retried(clock):
+    gateway = _gateway(InMemoryFirestore())
+    calls = []
+
+    def missing(retry=None, timeout=None):
+        calls.append(1)
+        raise gexc.NotFound('gone')
+
+    with pytest.raises(gexc.NotFound):
+        gateway.call('op', missing)
+    assert len(calls) == 1
+    assert gateway.online
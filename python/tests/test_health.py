@@ -0,0 +1,41 @@
+from health import DEGRADED, HEALTHY, OFFLINE, CircuitBreaker
+
+
+def _breaker():
+    return CircuitBreaker('test', threshold=3, retry_delay=2.0, base_backoff=5.0, max_backoff=20.0, jitter=0)
+
+
+def test_quick_retries_then_exponential_backoff():
+    breaker = _breaker()
+    assert breaker.record_failure() == 2.0
+    assert breaker.record_failure() == 2.0
+    assert breaker.state == DEGRADED
+
+    assert [breaker.record_failure() for _ in range(4)] == [5.0, 10.0, 20.0, 20.0]
+    assert breaker.state == OFFLINE
+
+
+def test_half_open_failure_trips_again_with_a_longer_backoff():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    breaker.half_open()
+    assert breaker.state == DEGRADED
+    assert breaker.record_failure() == 10.0
+    assert breaker.state == OFFLINE
+
+
+def test_success_closes_the_breaker():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record_failure()
+    breaker.half_open()
+    breaker.record_success()
+    assert breaker.stats() == {'state': HEALTHY, 'failures': 0, 'trips': 0}
+    assert breaker.record_failure() == 2.0
+
+
+def test_jitter_stays_within_bounds():
+    breaker = CircuitBreaker('test', threshold=1, base_backoff=10.0, jitter=0.2)
+    delays = [breaker.backoff() for _ in range(100)]
+    assert all(8.0 <= delay <= 12.0 for delay in delays)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from history_query import downsample, lttb_indices, minmax_indices
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=1000)
+    y[123], y[877] = 10.0, -10.0
+    picks = minmax_indices(y, 50)
+    assert len(picks) <= 100
+    assert np.all(np.diff(picks) > 0)
+    assert {123, 877} <= set(picks.tolist())
+
+
+def test_minmax_returns_short_series_unchanged():
+    assert minmax_indices(np.arange(10.0), 5).tolist() == list(range(10))
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[500] = 50.0
+    picks = lttb_indices(x, y, 20)
+    assert len(picks) == 20
+    assert picks[0] == 0 and picks[-1] == 999
+    assert np.all(np.diff(picks) > 0)
+    assert 500 in picks
+
+
+def test_lttb_returns_short_series_unchanged():
+    x = np.arange(10.0)
+    assert lttb_indices(x, x, 10).tolist() == list(range(10))
+    assert lttb_indices(x, x, 2).tolist() == list(range(10))
+
+
+def test_downsample_applies_picks_to_every_channel():
+    t = np.arange(100.0)
+    moisture = np.sin(t)
+    temperature = t * 2
+    t2, moisture2, temperature2 = downsample(t, moisture, temperature, 10, 'lttb')
+    assert len(t2) == 10
+    assert np.array_equal(temperature2, t2 * 2)
+    assert np.array_equal(moisture2, np.sin(t2))
@@ -0,0 +1,53 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from offline_queue import OfflineQueue
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _item(i):
+    return {'hardwareId': 'S1', 'moisture': float(i), 'sampledAt': T0 + timedelta(seconds=i)}
+
+
+def test_rows_come_back_in_order_until_acked(tmp_path):
+    queue = OfflineQueue(str(tmp_path / 'q.db'))
+    queue.push_many([_item(i) for i in range(5)])
+    rows = queue.peek(3)
+    assert [item['moisture'] for _, item in rows] == [0.0, 1.0, 2.0]
+    assert rows[0][1]['sampledAt'] == T0
+
+    queue.ack([row_id for row_id, _ in rows])
+    assert queue.pending() == 2
+    assert [item['moisture'] for _, item in queue.peek(10)] == [3.0, 4.0]
+    queue.close()
+
+
+def test_backlog_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'q.db')
+    queue = OfflineQueue(path)
+    queue.push_many([_item(i) for i in range(3)])
+    queue.close()
+
+    queue = OfflineQueue(path)
+    assert queue.pending() == 3
+    queue.close()
+
+
+def test_oldest_rows_are_evicted_at_max_rows(tmp_path, caplog):
+    queue = OfflineQueue(str(tmp_path / 'q.db'), max_rows=5)
+    with caplog.at_level(logging.WARNING, logger='offline_queue'):
+        for i in range(8):
+            queue.push_many([_item(i)])
+    assert queue.pending() == 5
+    assert [item['moisture'] for _, item in queue.peek(10)] == [3.0, 4.0, 5.0, 6.0, 7.0]
+    # One warning for the whole full stretch, not one per push
+    assert len(caplog.records) == 1
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='offline_queue'):
+        queue.ack([row_id for row_id, _ in queue.peek(2)])
+    assert queue.pending() == 3
+    assert len(caplog.records) == 1
+    assert '3 oldest' in caplog.records[0].getMessage()
+    queue.close()
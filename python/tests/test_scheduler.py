@@ -0,0 +1,39 @@
+from scheduler import PeriodicSchedule
+
+
+def test_ticks_stay_on_the_grid():
+    schedule = PeriodicSchedule(1.0, clock=lambda: 0.0)
+    schedule.start_tick(now=0.0)
+    schedule.finish_tick(now=0.3)
+    assert schedule.deadline == 1.0
+
+    schedule.start_tick(now=1.2)
+    schedule.finish_tick(now=1.5)
+    assert schedule.deadline == 2.0
+    assert schedule.stats()['jitter_ms_max'] == 200.0
+
+
+def test_overrun_skips_missed_ticks_instead_of_bursting():
+    schedule = PeriodicSchedule(1.0, clock=lambda: 0.0)
+    schedule.start_tick(now=0.0)
+    schedule.finish_tick(now=3.4)
+    assert schedule.deadline == 4.0
+    assert schedule.missed == 3
+    assert schedule.overruns == 1
+
+
+def test_backoff_delay_snaps_to_the_next_grid_point():
+    schedule = PeriodicSchedule(1.0, clock=lambda: 0.0)
+    schedule.start_tick(now=0.0)
+    schedule.finish_tick(delay=2.5, now=0.2)
+    assert schedule.deadline == 3.0
+    assert schedule.missed == 0
+
+
+def test_reset_reanchors_the_grid():
+    schedule = PeriodicSchedule(2.0, clock=lambda: 0.0)
+    schedule.finish_tick(now=0.5)
+    schedule.reset(now=10.25)
+    assert schedule.due(now=10.25)
+    schedule.finish_tick(now=10.5)
+    assert schedule.deadline == 12.25
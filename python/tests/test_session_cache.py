@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from firestore_gateway import FirestoreGateway
+from session_cache import SessionCache
+from simulator import InMemoryFirestore, claim_session
+
+
+@pytest.fixture
+def db():
+    return InMemoryFirestore()
+
+
+def _cache(db):
+    return SessionCache(db, 'S1', timeout_minutes=10, ttl=300, gateway=FirestoreGateway(db))
+
+
+def _stale_session(db, minutes=30):
+    db.collection('sensor_sessions').document('S1').set({
+        'userId': 'u1',
+        'fieldId': 'f1',
+        'active': True,
+        'lastHeartbeat': datetime.now(timezone.utc) - timedelta(minutes=minutes),
+    })
+
+
+def _go_offline(cache):
+    for _ in range(cache.gateway.breaker.threshold):
+        cache.gateway.breaker.record_failure()
+
+
+def test_fresh_session_is_live(db):
+    claim_session(db, 'S1', 'u1', 'f1')
+    cache = _cache(db)
+    assert cache.get()['userId'] == 'u1'
+
+
+def test_stale_heartbeat_expires_while_online(db):
+    _stale_session(db)
+    cache = _cache(db)
+    assert cache.get() is None
+
+
+def test_locally_queued_heartbeat_counts_as_liveness(db):
+    _stale_session(db)
+    cache = _cache(db)
+    cache.note_heartbeat()
+    assert cache.get()['userId'] == 'u1'
+
+
+def test_session_does_not_expire_while_gateway_is_offline(db):
+    _stale_session(db, minutes=600)
+    cache = _cache(db)
+    cache.refresh()
+    _go_offline(cache)
+    assert not cache.gateway.online
+    assert cache.get()['userId'] == 'u1'
+
+
+def test_release_ends_the_session_even_offline(db):
+    claim_session(db, 'S1', 'u1', 'f1')
+    cache = _cache(db)
+    cache.start()
+    assert cache.get() is not None
+
+    _go_offline(cache)
+    db.collection('sensor_sessions').document('S1').delete()
+    assert cache.get() is None
+    cache.stop()
+
+
+def test_listener_wakes_waiters_on_claim(db):
+    cache = _cache(db)
+    cache.start()
+    assert cache.wait_for_session(0.01) is None
+    claim_session(db, 'S1', 'u1', 'f1')
+    assert cache.wait_for_session(1)['fieldId'] == 'f1'
+    cache.stop()
@@ -0,0 +1,123 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from firestore_gateway import FirestoreGateway
+from offline_queue import OfflineQueue
+from simulator import InMemoryFirestore, claim_session
+from uploader import BatchUploader
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _submit(uploader, hardware_id, values):
+    for i in values:
+        uploader.submit(hardware_id, 'u1', 'f1', float(i), 20.0, 'ok', 'ok', T0 + timedelta(seconds=i))
+
+
+def _readings(db, hardware_id):
+    docs = db.collection('faminga_sensors').document(hardware_id).collection('readings').stream()
+    return [doc.to_dict()['moisture'] for doc in docs]
+
+
+def _snapshot(db, hardware_id):
+    return db.collection('faminga_sensors').document(hardware_id).get().to_dict()
+
+
+@pytest.fixture
+def db():
+    db = InMemoryFirestore()
+    claim_session(db, 'S1', 'u1', 'f1')
+    claim_session(db, 'S2', 'u1', 'f1')
+    return db
+
+
+@pytest.fixture
+def make_uploader(db, tmp_path):
+    uploaders = []
+
+    def make(**kwargs):
+        # A high threshold keeps the gateway from going offline: drains retry every retry_interval
+        gateway = FirestoreGateway(db, attempts=1, failure_threshold=1000)
+        uploader = BatchUploader(db, offline_queue=OfflineQueue(str(tmp_path / 'q.db')),
+                                 retry_interval=0.05, gateway=gateway, **kwargs)
+        uploaders.append(uploader)
+        return uploader
+
+    yield make
+    for uploader in uploaders:
+        uploader.stop()
+
+
+def test_queued_readings_share_one_batch(db, make_uploader):
+    uploader = make_uploader()
+    writes = db.writes
+    _submit(uploader, 'S1', range(3))
+    _submit(uploader, 'S2', range(2))
+    uploader.start()
+    _wait_until(lambda: uploader.pending() == 0 and len(_readings(db, 'S2')) == 2)
+
+    assert _readings(db, 'S1') == [0.0, 1.0, 2.0]
+    # 5 readings, one snapshot and one heartbeat per sensor
+    assert db.writes - writes == 5 + 2 + 2
+    assert _snapshot(db, 'S1')['moisture'] == 2.0
+    assert _snapshot(db, 'S2')['moisture'] == 1.0
+
+
+def test_commit_is_split_at_max_readings(db, make_uploader):
+    uploader = make_uploader(max_readings_per_commit=2)
+    _submit(uploader, 'S1', range(5))
+    batches = []
+    uploader.commit = batches.append
+    uploader.start()
+    _wait_until(lambda: sum(map(len, batches)) == 5)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_outage_spills_to_disk_and_drains_in_order(db, make_uploader):
+    uploader = make_uploader(max_readings_per_commit=3)
+    db.offline = True
+    uploader.start()
+    _submit(uploader, 'S1', range(5))
+    _wait_until(lambda: uploader.offline_queue.pending() == 5)
+    assert _readings(db, 'S1') == []
+
+    # Readings taken while the backlog drains go behind it
+    db.offline = False
+    _submit(uploader, 'S1', range(5, 10))
+    _wait_until(lambda: len(_readings(db, 'S1')) == 10)
+    assert _readings(db, 'S1') == [float(i) for i in range(10)]
+    assert uploader.pending() == 0
+    assert _snapshot(db, 'S1')['moisture'] == 9.0
+
+
+def test_stop_persists_readings_still_in_memory(db, make_uploader, tmp_path):
+    uploader = make_uploader(max_readings_per_commit=1)
+    db.latency = 0.3
+    _submit(uploader, 'S1', range(4))
+    uploader.start()
+    # Stop while the first commit is in flight: the rest is still queued in memory
+    time.sleep(0.1)
+    uploader.stop()
+
+    assert _readings(db, 'S1') == [0.0]
+    queue = OfflineQueue(str(tmp_path / 'q.db'))
+    assert [item['moisture'] for _, item in queue.peek(10)] == [1.0, 2.0, 3.0]
+    queue.close()
+
+
+def test_released_session_still_uploads_readings(db, make_uploader):
+    uploader = make_uploader()
+    db.collection('sensor_sessions').document('S1').delete()
+    _submit(uploader, 'S1', [0])
+    uploader.start()
+    _wait_until(lambda: uploader.pending() == 0 and _readings(db, 'S1') == [0.0])
+    assert _snapshot(db, 'S1')['moisture'] == 0.0
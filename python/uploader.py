@@ -0,0 +1,403 @@
+"""Background Firestore upload stage for soil sensor readings."""
+import asyncio
+import logging
+import queue
+import threading
+import time
+
+from firebase_admin import firestore
+from google.api_core import exceptions as gexc
+
+from firestore_gateway import FirestoreGateway
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class BatchUploader:
+    """Upload readings from a background thread, one WriteBatch per commit.
+
+    Each commit writes one `readings` document per sample plus, for sensors
+    with a reading newer than their last snapshot, the `faminga_sensors/{id}`
+    snapshot of the newest submitted reading and a session heartbeat (at most
+    once per `heartbeat_interval` seconds per sensor). While a
+    commit is in flight new readings keep queueing, so a slow link
+    automatically coalesces several cycles into the next commit and the
+    sampling loop never waits on the network.
+
+    If an `offline_queue` is given, readings from failed commits are spilled
+    to disk. While that backlog is non-empty new readings are appended
+    behind it, and the backlog is drained in bulk batches once a commit
+    succeeds again. Replayed rows only become history documents: the live
+    snapshot always shows the newest reading, never an old one.
+
+    Commits go through `gateway` (deadline, retries, offline fast-fail); a
+    private FirestoreGateway is created if none is shared.
+    """
+
+    def __init__(self, db, offline_queue=None, max_pending=1000,
+                 max_readings_per_commit=100, retry_interval=15, heartbeat_interval=60, gateway=None):
+        self.db = db
+        self.gateway = gateway or FirestoreGateway(db)
+        self.offline_queue = offline_queue
+        self.retry_interval = retry_interval
+        # Session listeners are billed per change, so heartbeat at most this often
+        self.heartbeat_interval = heartbeat_interval
+        self._last_heartbeat = {}
+        # Newest submitted reading per sensor, and the sampledAt of the last snapshot written
+        self._newest = {}
+        self._snapshot_at = {}
+        # Worst case every reading belongs to a different sensor: 3 writes each
+        self.max_readings_per_commit = min(max_readings_per_commit, MAX_BATCH_WRITES // 3)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="firestore-uploader", daemon=True)
+        self._thread.start()
+        logger.info("Firestore upload stage started")
+
+    def stop(self, timeout=10):
+        """Stop the worker thread, spilling or flushing what is still queued."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Upload stage did not stop in time, leaving the offline queue open")
+                return
+        if self.offline_queue:
+            self.offline_queue.close()
+
+    def submit(self, hardware_id, user_id, field_id, moisture, temperature,
+               moisture_status, temp_status, sampled_at, stats=None):
+        """Queue one reading for upload without blocking the caller.
+
+        `stats` is an optional window summary (per-channel min/max/mean/stddev,
+        sampleCount, windowSeconds) stored alongside the reading.
+        """
+        item = {
+            'hardwareId': hardware_id,
+            'userId': user_id,
+            'fieldId': field_id,
+            'moisture': moisture,
+            'temperature': temperature,
+            'moisture_status': moisture_status,
+            'temp_status': temp_status,
+            'sampledAt': sampled_at,
+        }
+        if stats:
+            item['stats'] = stats
+        self._newest[hardware_id] = item
+        self._enqueue(item)
+
+    def _enqueue(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                # Keep the newest data: drop the oldest pending reading
+                try:
+                    self._queue.get_nowait()
+                    logger.warning("Upload queue full, dropped oldest pending reading")
+                except queue.Empty:
+                    pass
+
+    def pending(self):
+        """Readings not yet uploaded (in memory plus on disk)."""
+        return self._queue.qsize() + self._backlog()
+
+    def _run(self):
+        next_drain = 0
+        while not self._stop.is_set():
+            backlog = self._backlog()
+            try:
+                first = self._queue.get(timeout=self._wait_time(backlog))
+                items = [first] + self._take(self._queue.get_nowait, self.max_readings_per_commit - 1)
+            except queue.Empty:
+                items = []
+
+            if backlog:
+                self._queue_behind_backlog(items)
+                if time.monotonic() >= next_drain:
+                    next_drain = self._next_drain(self._drain_backlog())
+            elif items:
+                try:
+                    self.commit(items)
+                except Exception as e:
+                    if self._spill(items, e):
+                        next_drain = self._next_drain(False)
+                    else:
+                        time.sleep(1)
+
+        # Shutting down: persist whatever is still in memory
+        leftover = self._take(self._queue.get_nowait)
+        if leftover and not self._persist_leftover(leftover):
+            try:
+                self.commit(leftover)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(leftover)} reading(s) on shutdown: {e}")
+
+    # Decisions shared by the thread loop and AsyncBatchUploader.run(); the
+    # loops themselves only differ in how they wait and where disk I/O runs.
+
+    def _backlog(self):
+        return self.offline_queue.pending() if self.offline_queue else 0
+
+    @staticmethod
+    def _wait_time(backlog):
+        # Poll faster while a backlog is draining
+        return 1 if backlog == 0 else 0.2
+
+    def _take(self, get_nowait, limit=None):
+        """Pop queued readings with `get_nowait` until empty or `limit` are taken."""
+        items = []
+        while limit is None or len(items) < limit:
+            try:
+                items.append(get_nowait())
+            except (queue.Empty, asyncio.QueueEmpty):
+                break
+        return items
+
+    def _queue_behind_backlog(self, items):
+        # Keep upload order: new readings go behind the disk backlog
+        self.offline_queue.push_many(items)
+
+    def _next_drain(self, drained):
+        """When to try the backlog again: at once after a success, else after retry_interval."""
+        return 0 if drained else time.monotonic() + self.retry_interval
+
+    def _spill(self, items, error):
+        """Handle a failed commit; True if the readings were kept in the offline queue."""
+        logger.error(f"Failed to upload to Firestore: {error}")
+        if not self.offline_queue:
+            return False
+        self.offline_queue.push_many(items)
+        logger.warning(f"Spilled {len(items)} reading(s) to offline queue "
+                       f"({self.offline_queue.pending()} pending)")
+        return True
+
+    def _persist_leftover(self, items):
+        """Keep readings still in memory at shutdown on disk; False without an offline queue."""
+        if not self.offline_queue:
+            return False
+        self.offline_queue.push_many(items)
+        return True
+
+    def _peek_backlog(self):
+        return self.offline_queue.peek(self.max_readings_per_commit)
+
+    def _backlog_failed(self, error):
+        logger.warning(f"Still offline, {self.offline_queue.pending()} reading(s) pending: {error}")
+
+    def _ack_backlog(self, rows):
+        self.offline_queue.ack([row_id for row_id, _ in rows])
+        if self.offline_queue.pending() == 0:
+            logger.info("Offline backlog fully uploaded")
+
+    def _drain_backlog(self):
+        """Upload one bulk batch from the offline queue. Returns True on success."""
+        rows = self._peek_backlog()
+        if not rows:
+            return True
+        try:
+            self.commit([item for _, item in rows])
+        except Exception as e:
+            self._backlog_failed(e)
+            return False
+        self._ack_backlog(rows)
+        return True
+
+    def heartbeat_due(self, hardware_id, now=None):
+        """True if this sensor's session heartbeat is older than heartbeat_interval."""
+        now = time.monotonic() if now is None else now
+        return now - self._last_heartbeat.get(hardware_id, float('-inf')) >= self.heartbeat_interval
+
+    def mark_heartbeat(self, hardware_ids, now=None):
+        now = time.monotonic() if now is None else now
+        for hardware_id in hardware_ids:
+            self._last_heartbeat[hardware_id] = now
+
+    def _snapshots_due(self, items):
+        """{hardware_id: newest reading} for sensors in `items` whose snapshot is behind."""
+        due = {}
+        for hardware_id in {item['hardwareId'] for item in items}:
+            newest = self._newest.get(hardware_id)
+            # No newest reading: rows replayed from a previous run, history only
+            if newest is not None and self._snapshot_at.get(hardware_id) != newest['sampledAt']:
+                due[hardware_id] = newest
+        return due
+
+    def _mark_snapshots(self, snapshots):
+        for hardware_id, item in snapshots.items():
+            self._snapshot_at[hardware_id] = item['sampledAt']
+
+    def _plan_commit(self, items):
+        """(now, snapshots, heartbeats) to write along with `items`."""
+        now = time.monotonic()
+        snapshots = self._snapshots_due(items)
+        heartbeats = {hardware_id for hardware_id in snapshots if self.heartbeat_due(hardware_id, now)}
+        return now, snapshots, heartbeats
+
+    @staticmethod
+    def _without_heartbeats():
+        # The session document was deleted (sensor released); the
+        # readings themselves are still valid, so retry without it.
+        logger.warning("Session document missing, committing readings without heartbeat")
+        return set()
+
+    def _committed(self, items, now, snapshots, heartbeats):
+        self._mark_snapshots(snapshots)
+        self.mark_heartbeat(heartbeats, now)
+        sensors = {item['hardwareId'] for item in items}
+        logger.info(f"Uploaded {len(items)} reading(s) for {len(sensors)} sensor(s) in one batch")
+
+    def commit(self, items):
+        """Write a list of queued readings as one batch."""
+        now, snapshots, heartbeats = self._plan_commit(items)
+        try:
+            self.gateway.call('batch_commit', self._build_batch(items, snapshots, heartbeats).commit)
+        except gexc.NotFound:
+            heartbeats = self._without_heartbeats()
+            self.gateway.call('batch_commit', self._build_batch(items, snapshots, heartbeats).commit)
+        self._committed(items, now, snapshots, heartbeats)
+
+    def _build_batch(self, items, snapshots, heartbeats):
+        batch = self.db.batch()
+
+        for item in items:
+            doc_ref = self.db.collection('faminga_sensors').document(item['hardwareId'])
+            reading = {
+                'userId': item['userId'],
+                'fieldId': item['fieldId'],
+                'moisture': item['moisture'],
+                'temperature': item['temperature'],
+                'moisture_status': item['moisture_status'],
+                'temp_status': item['temp_status'],
+                'timestamp': item['sampledAt'],
+            }
+            if 'stats' in item:
+                reading['stats'] = item['stats']
+            batch.set(doc_ref.collection('readings').document(), reading)
+
+        for hardware_id, item in snapshots.items():
+            doc_ref = self.db.collection('faminga_sensors').document(hardware_id)
+            snapshot = {
+                'userId': item['userId'],
+                'fieldId': item['fieldId'],
+                'hardwareId': hardware_id,
+                'moisture': item['moisture'],
+                'temperature': item['temperature'],
+                'moisture_status': item['moisture_status'],
+                'temp_status': item['temp_status'],
+                'timestamp': firestore.SERVER_TIMESTAMP
+            }
+            if 'stats' in item:
+                snapshot['stats'] = item['stats']
+            batch.set(doc_ref, snapshot)
+            if hardware_id in heartbeats:
+                session_ref = self.db.collection('sensor_sessions').document(hardware_id)
+                batch.update(session_ref, {'lastHeartbeat': firestore.SERVER_TIMESTAMP})
+
+        return batch
+
+
+class AsyncBatchUploader(BatchUploader):
+    """BatchUploader for the asyncio runtime, committing with the async Firestore client.
+
+    Batching, coalescing, heartbeats and the offline queue behave exactly as
+    in BatchUploader. `submit()` stays callable from executor threads; items
+    are handed to the event loop with `call_soon_threadsafe`. Pass the
+    gateway of the synchronous client: its offline probe is a blocking read.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._loop = None
+        self._aqueue = None
+
+    def start(self):
+        raise RuntimeError("AsyncBatchUploader is driven by awaiting run()")
+
+    def _enqueue(self, item):
+        if self._loop is None:
+            # Not running yet: park it in the thread queue, run() picks it up
+            super()._enqueue(item)
+        else:
+            self._loop.call_soon_threadsafe(self._put_nowait, item)
+
+    def _put_nowait(self, item):
+        if self._aqueue.full():
+            self._aqueue.get_nowait()
+            logger.warning("Upload queue full, dropped oldest pending reading")
+        self._aqueue.put_nowait(item)
+
+    def pending(self):
+        in_loop = self._aqueue.qsize() if self._aqueue else 0
+        return super().pending() + in_loop
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._aqueue = asyncio.Queue(maxsize=self._queue.maxsize)
+        for item in self._take(self._queue.get_nowait):
+            self._put_nowait(item)
+        logger.info("Async Firestore upload stage started")
+
+        next_drain = 0
+        try:
+            while True:
+                backlog = self._backlog()
+                try:
+                    first = await asyncio.wait_for(self._aqueue.get(), self._wait_time(backlog))
+                    items = [first] + self._take(self._aqueue.get_nowait, self.max_readings_per_commit - 1)
+                except asyncio.TimeoutError:
+                    items = []
+
+                if backlog:
+                    await asyncio.to_thread(self._queue_behind_backlog, items)
+                    if time.monotonic() >= next_drain:
+                        next_drain = self._next_drain(await self._drain_backlog_async())
+                elif items:
+                    try:
+                        await self.commit_async(items)
+                    except Exception as e:
+                        if await asyncio.to_thread(self._spill, items, e):
+                            next_drain = self._next_drain(False)
+                        else:
+                            await asyncio.sleep(1)
+        finally:
+            # Cancelled (shutdown): persist whatever is still in memory
+            leftover = self._take(self._aqueue.get_nowait)
+            if leftover:
+                self._persist_leftover(leftover)
+            if self.offline_queue:
+                self.offline_queue.close()
+
+    async def _drain_backlog_async(self):
+        """Upload one bulk batch from the offline queue. Returns True on success."""
+        rows = await asyncio.to_thread(self._peek_backlog)
+        if not rows:
+            return True
+        try:
+            await self.commit_async([item for _, item in rows])
+        except Exception as e:
+            self._backlog_failed(e)
+            return False
+        await asyncio.to_thread(self._ack_backlog, rows)
+        return True
+
+    async def commit_async(self, items):
+        """Write a list of queued readings as one batch."""
+        now, snapshots, heartbeats = self._plan_commit(items)
+        try:
+            await self.gateway.call_async('batch_commit', self._build_batch(items, snapshots, heartbeats).commit)
+        except gexc.NotFound:
+            heartbeats = self._without_heartbeats()
+            await self.gateway.call_async('batch_commit', self._build_batch(items, snapshots, heartbeats).commit)
+        self._committed(items, now, snapshots, heartbeats)